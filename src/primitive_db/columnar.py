@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+"""
+Колоночное хранение строк таблицы в памяти.
+
+int хранится в array('q'), bool - в bytearray (байт на строку),
+str - словарным кодированием: array кодов и список различных строк.
+Позиция строки общая для всех столбцов; удалённая строка помечается
+нулём в alive и физически убирается при уплотнении.
+
+Каждая позиция - версия строки со штампами born и died: версия видна
+читателю со снимком stamp, если born <= stamp < died. Штампы растут
+вместе с позицией (born) и порядком удалений (deaths), поэтому view()
+собирает видимость снимка без прохода по всем штампам. Массивы штампов
+заводятся только при первом изменении, которое должно быть скрыто от
+открытого снимка (track_versions); до того у каждой позиции born 0, а
+died - NEVER у живой и 0 у удалённой.
+
+Столбец, прочитанный из бинарного сегмента, ссылается на memoryview
+поверх mmap и копируется в память только при первом изменении. Так же
+работает fork(): хранилище для транзакции разделяет буферы с исходным
+и копирует столбец (или alive) перед первой перезаписью. Новые строки
+дописываются прямо в общие буферы, и откат отрезает их truncate() до
+длин, запомненных mark().
+"""
+from array import array
+from bisect import bisect_right
+from itertools import islice
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+INT64_MIN = -(2 ** 63)
+INT64_MAX = 2 ** 63 - 1
+
+# died живой версии: больше любого штампа
+NEVER = INT64_MAX
+
+
+class IntColumn:
+    """Столбец int: 8 байт на значение."""
+
+    def __init__(self, values: Iterable[int] = ()) -> None:
+        self.data = array('q', values)
+
+    @classmethod
+    def from_buffer(cls, view: memoryview) -> "IntColumn":
+        """Столбец поверх готового буфера int64 без копирования."""
+        column = cls()
+        column.data = view
+        return column
+
+    def _writable(self) -> array:
+        if not isinstance(self.data, array):
+            data = array('q')
+            data.frombytes(self.data.cast('B'))
+            self.data = data
+        return self.data
+
+    def check(self, name: str, value: Any) -> None:
+        if not INT64_MIN <= value <= INT64_MAX:
+            raise ValueError(
+                f'Значение для столбца "{name}" вне диапазона int64: {value}'
+            )
+
+    def check_many(self, name: str, values: List[int]) -> None:
+        if values:
+            self.check(name, min(values))
+            self.check(name, max(values))
+
+    def append(self, value: int) -> None:
+        self._writable().append(value)
+
+    def extend(self, values: Iterable[int]) -> None:
+        self._writable().extend(values)
+
+    def get(self, position: int) -> int:
+        return self.data[position]
+
+    def set(self, position: int, value: int) -> None:
+        self._writable()[position] = value
+
+    def getter(self) -> Callable[[int], Any]:
+        return self.data.__getitem__
+
+    def values(self) -> List[int]:
+        return self.data.tolist()
+
+    def take(self, positions: List[int]) -> "IntColumn":
+        data = self.data
+        return IntColumn(data[position] for position in positions)
+
+    def copy(self) -> "IntColumn":
+        # Срез array - копия, срез memoryview над сегментом - он сам
+        return IntColumn.from_buffer(self.data[:])
+
+    def mark(self) -> int:
+        return len(self.data)
+
+    def truncate(self, mark: int) -> None:
+        if len(self.data) > mark:
+            del self._writable()[mark:]
+
+
+class BoolColumn:
+    """Столбец bool: байт на значение."""
+
+    def __init__(self, values: Iterable[bool] = ()) -> None:
+        self.data = bytearray(values)
+
+    @classmethod
+    def from_buffer(cls, view: memoryview) -> "BoolColumn":
+        """Столбец поверх готового буфера байтов без копирования."""
+        column = cls()
+        column.data = view
+        return column
+
+    def _writable(self) -> bytearray:
+        if not isinstance(self.data, bytearray):
+            self.data = bytearray(self.data)
+        return self.data
+
+    def check(self, name: str, value: Any) -> None:
+        pass
+
+    def check_many(self, name: str, values: List[bool]) -> None:
+        pass
+
+    def append(self, value: bool) -> None:
+        self._writable().append(value)
+
+    def extend(self, values: Iterable[bool]) -> None:
+        self._writable().extend(values)
+
+    def get(self, position: int) -> bool:
+        return self.data[position] == 1
+
+    def set(self, position: int, value: bool) -> None:
+        self._writable()[position] = value
+
+    def getter(self) -> Callable[[int], Any]:
+        data = self.data
+        return lambda position: data[position] == 1
+
+    def values(self) -> List[bool]:
+        return [value == 1 for value in self.data]
+
+    def take(self, positions: List[int]) -> "BoolColumn":
+        data = self.data
+        return BoolColumn(data[position] for position in positions)
+
+    def copy(self) -> "BoolColumn":
+        return BoolColumn.from_buffer(self.data[:])
+
+    def mark(self) -> int:
+        return len(self.data)
+
+    def truncate(self, mark: int) -> None:
+        if len(self.data) > mark:
+            del self._writable()[mark:]
+
+
+class StrColumn:
+    """Столбец str со словарным кодированием."""
+
+    def __init__(self, values: Iterable[str] = ()) -> None:
+        self.codes = array('q')
+        self.dictionary: List[str] = []
+        self.lookup: Dict[str, int] = {}
+        for value in values:
+            self.append(value)
+
+    @classmethod
+    def from_buffer(
+        cls, codes: memoryview, dictionary: List[str]
+    ) -> "StrColumn":
+        """Столбец поверх готового буфера кодов и словаря."""
+        column = cls()
+        column.codes = codes
+        column.dictionary = dictionary
+        column.lookup = {value: code for code, value in enumerate(dictionary)}
+        return column
+
+    def _writable(self) -> array:
+        if not isinstance(self.codes, array):
+            codes = array('q')
+            codes.frombytes(self.codes.cast('B'))
+            self.codes = codes
+        return self.codes
+
+    def check(self, name: str, value: Any) -> None:
+        pass
+
+    def check_many(self, name: str, values: List[str]) -> None:
+        pass
+
+    def encode(self, value: str) -> int:
+        """Код строки, новые строки добавляются в словарь."""
+        code = self.lookup.get(value)
+        if code is None:
+            code = len(self.dictionary)
+            self.dictionary.append(value)
+            self.lookup[value] = code
+        return code
+
+    def append(self, value: str) -> None:
+        self._writable().append(self.encode(value))
+
+    def extend(self, values: Iterable[str]) -> None:
+        self._writable().extend(map(self.encode, values))
+
+    def get(self, position: int) -> str:
+        return self.dictionary[self.codes[position]]
+
+    def set(self, position: int, value: str) -> None:
+        self._writable()[position] = self.encode(value)
+
+    def getter(self) -> Callable[[int], Any]:
+        codes, dictionary = self.codes, self.dictionary
+        return lambda position: dictionary[codes[position]]
+
+    def values(self) -> List[str]:
+        dictionary = self.dictionary
+        return [dictionary[code] for code in self.codes]
+
+    def take(self, positions: List[int]) -> "StrColumn":
+        return StrColumn(self.get(position) for position in positions)
+
+    def copy(self) -> "StrColumn":
+        column = StrColumn()
+        column.codes = self.codes[:]
+        column.dictionary = list(self.dictionary)
+        column.lookup = dict(self.lookup)
+        return column
+
+    def mark(self) -> Tuple[int, int]:
+        return len(self.codes), len(self.dictionary)
+
+    def truncate(self, mark: Tuple[int, int]) -> None:
+        count, words = mark
+        if len(self.codes) > count:
+            del self._writable()[count:]
+        for value in self.dictionary[words:]:
+            del self.lookup[value]
+        del self.dictionary[words:]
+
+
+COLUMN_TYPES = {'int': IntColumn, 'bool': BoolColumn, 'str': StrColumn}
+
+# Имя флагов живых строк и штампов версий в ColumnStore.shared (не
+# пересекается с именами столбцов)
+ALIVE = ''
+
+
+class ColumnStore:
+    """Строки таблицы по столбцам."""
+
+    def __init__(self, columns: List[Tuple[str, str]]) -> None:
+        self.schema = [tuple(column) for column in columns]
+        self.names = [name for name, _ in self.schema]
+        self.columns: Dict[str, Any] = {
+            name: COLUMN_TYPES[col_type]() for name, col_type in self.schema
+        }
+        self.alive = bytearray()
+        self.init_versions(0)
+        # Столбцы (и ALIVE), разделяемые с хранилищем, от которого
+        # сделан fork(); перед изменением они копируются
+        self.shared: Set[str] = set()
+
+    @classmethod
+    def from_rows(
+        cls, columns: List[Tuple[str, str]], rows: List[Dict]
+    ) -> "ColumnStore":
+        """Собирает хранилище из списка строк-словарей."""
+        store = cls(columns)
+        for name, col_type in store.schema:
+            store.columns[name] = COLUMN_TYPES[col_type](
+                row[name] for row in rows
+            )
+        store.init_versions(len(rows))
+        return store
+
+    def init_versions(self, count: int) -> None:
+        """Все count позиций - живые строки, видимые любому снимку."""
+        self.alive = bytearray(b'\x01') * count
+        # Штампы версий; None - ещё не заведены (track_versions)
+        self.born: Optional[array] = None
+        self.died: Optional[array] = None
+        # Удалённые со штампами позиции в порядке удаления (по росту died)
+        self.deaths = array('q')
+        # Позиция версии -> позиция предыдущей версии той же строки
+        self.prior: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        """Число позиций, включая удалённые."""
+        return len(self.alive)
+
+    def track_versions(self) -> None:
+        """Заводит штампы born/died: следующие изменения снимок не увидит.
+
+        Все прежние позиции получают born 0, удалённые - died 0: снимок,
+        открытый до этого, видит ровно живые сейчас строки.
+        """
+        if self.born is not None:
+            return
+        count = len(self.alive)
+        self.born = array('q', [0]) * count
+        self.died = died = array('q', [NEVER]) * count
+        find = self.alive.find
+        position = find(0)
+        while position != -1:
+            died[position] = 0
+            position = find(0, position + 1)
+
+    def fork(self) -> "ColumnStore":
+        """Хранилище с теми же строками без копирования буферов.
+
+        Перезапись в fork не видна исходному хранилищу: столбец
+        копируется перед первым set, alive и штампы - перед первым
+        kill. Новые строки fork дописывает в общие буферы; исходное
+        хранилище возвращает к прежним строкам truncate(mark()).
+        """
+        store = ColumnStore(self.schema)
+        store.columns = dict(self.columns)
+        store.alive = self.alive
+        store.born, store.died = self.born, self.died
+        store.deaths, store.prior = self.deaths, self.prior
+        store.shared = set(self.names) | {ALIVE}
+        return store
+
+    def mark(self) -> Dict[str, Any]:
+        """Длины буферов: truncate() вернёт к ним хранилище."""
+        marks = {name: column.mark() for name, column in self.columns.items()}
+        marks[ALIVE] = len(self.alive)
+        return marks
+
+    def truncate(self, marks: Dict[str, Any]) -> None:
+        """Отрезает строки (и слова словарей), дописанные после mark()."""
+        for name, column in self.columns.items():
+            column.truncate(marks[name])
+        count = marks[ALIVE]
+        del self.alive[count:]
+        if self.born is not None:
+            del self.born[count:]
+            del self.died[count:]
+        for position in [key for key in self.prior if key >= count]:
+            del self.prior[position]
+
+    def _own(self, names: Iterable[str]) -> None:
+        """Копирует разделяемые столбцы перед перезаписью."""
+        for name in names:
+            if name not in self.shared:
+                continue
+            self.shared.discard(name)
+            if name == ALIVE:
+                self.alive = self.alive[:]
+                if self.born is not None:
+                    self.born, self.died = self.born[:], self.died[:]
+                self.deaths, self.prior = self.deaths[:], dict(self.prior)
+            else:
+                self.columns[name] = self.columns[name].copy()
+
+    def append(self, record: Dict, stamp: int = 0) -> int:
+        """Добавляет версию строки и возвращает её позицию."""
+        columns = self.columns
+        for name in self.names:
+            columns[name].check(name, record[name])
+        for name in self.names:
+            columns[name].append(record[name])
+        if self.born is not None:
+            self.died.append(NEVER)
+            self.born.append(stamp)
+        self.alive.append(1)
+        return len(self.alive) - 1
+
+    def extend(self, records: List[Dict], stamp: int = 0) -> range:
+        """Добавляет пакет строк по столбцам и возвращает их позиции."""
+        columns = self.columns
+        values = {
+            name: [record[name] for record in records] for name in self.names
+        }
+        for name in self.names:
+            columns[name].check_many(name, values[name])
+        for name in self.names:
+            columns[name].extend(values[name])
+        if self.born is not None:
+            self.died.extend(array('q', [NEVER]) * len(records))
+            self.born.extend(array('q', [stamp]) * len(records))
+        start = len(self.alive)
+        self.alive.extend(b'\x01' * len(records))
+        return range(start, len(self.alive))
+
+    def get(self, position: int, name: str) -> Any:
+        return self.columns[name].get(position)
+
+    def set(self, position: int, name: str, value: Any) -> None:
+        self.columns[name].check(name, value)
+        if self.shared:
+            self._own((name,))
+        self.columns[name].set(position, value)
+
+    def kill(self, position: int, stamp: int = 0) -> None:
+        """Завершает версию: она остаётся видна снимкам старше stamp."""
+        if self.shared:
+            self._own((ALIVE,))
+        self.alive[position] = 0
+        if self.died is not None:
+            self.died[position] = stamp
+            self.deaths.append(position)
+
+    def is_alive(self, position: int) -> bool:
+        return self.alive[position] == 1
+
+    def positions(self) -> Iterator[int]:
+        """Позиции живых строк по возрастанию."""
+        alive = self.alive
+        find = alive.find
+        position = find(1)
+        while position != -1:
+            yield position
+            position = find(1, position + 1)
+
+    def row(self, position: int) -> Dict:
+        """Строка-словарь на позиции."""
+        columns = self.columns
+        return {name: columns[name].get(position) for name in self.names}
+
+    def rows(self, positions: Optional[List[int]] = None) -> List[Dict]:
+        """Строки-словари на позициях (по умолчанию - все живые)."""
+        if positions is None:
+            if self.alive.count(0) == 0:
+                names = self.names
+                values = [self.columns[name].values() for name in names]
+                # У view() столбцы длиннее alive: хвост - новые версии
+                return [
+                    dict(zip(names, row))
+                    for row in islice(zip(*values), len(self.alive))
+                ]
+            positions = list(self.positions())
+        return [self.row(position) for position in positions]
+
+    def column_values(self, name: str) -> List[Any]:
+        """Все значения столбца по позициям, включая удалённые."""
+        return self.columns[name].values()
+
+    def compact(self, positions: Optional[List[int]] = None) -> "ColumnStore":
+        """Новое хранилище только из живых строк.
+
+        positions - живые позиции в нужном порядке (по умолчанию - по
+        возрастанию).
+        """
+        if positions is None:
+            positions = list(self.positions())
+        store = ColumnStore(self.schema)
+        store.columns = {
+            name: column.take(positions)
+            for name, column in self.columns.items()
+        }
+        store.init_versions(len(positions))
+        return store
+
+    def view(self, stamp: int) -> "ColumnStore":
+        """Хранилище только для чтения: версии, видимые снимку stamp.
+
+        Столбцы общие с этим хранилищем: позиции версий не меняются,
+        а новые версии дописываются в конец, за границу снимка. Своя у
+        view только карта видимости alive.
+        """
+        if self.born is None:
+            # Штампов нет: после снимка строки не менялись
+            alive = self.alive[:]
+        else:
+            limit = bisect_right(self.born, stamp)
+            alive = self.alive[:limit]
+            died = self.died
+            # Позиции, удалённые после снимка, для него ещё живы
+            for position in reversed(self.deaths):
+                if died[position] <= stamp:
+                    break
+                if position < limit:
+                    alive[position] = 1
+        store = ColumnStore(self.schema)
+        store.columns = dict(self.columns)
+        store.alive = alive
+        return store
+
+    def snapshot(self) -> "ColumnStore":
+        """Независимая копия: её можно писать в фоне, пока идут изменения."""
+        store = ColumnStore(self.schema)
+        store.columns = {
+            name: column.copy() for name, column in self.columns.items()
+        }
+        store.alive = self.alive[:]
+        if self.born is not None:
+            store.born, store.died = self.born[:], self.died[:]
+        store.deaths, store.prior = self.deaths[:], dict(self.prior)
+        return store
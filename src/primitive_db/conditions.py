@@ -0,0 +1,471 @@
+#!/usr/bin/env python3
+"""
+Компиляция условий WHERE в предикаты.
+
+Грамматика (ключевые слова без учёта регистра):
+
+    expr      := and_expr (OR and_expr)*
+    and_expr  := not_expr (AND not_expr)*
+    not_expr  := NOT not_expr | '(' expr ')' | predicate
+    predicate := column op value
+               | column [NOT] IN '(' value (',' value)* ')'
+               | column [NOT] BETWEEN value AND value
+               | column [NOT] LIKE value
+
+Условие разбирается и приводится к типам столбцов один раз на запрос,
+а не для каждой строки. Каждый узел хранит готовый предикат над строкой
+и умеет привязаться к колоночному хранилищу (bind) - тогда предикат
+принимает позицию и читает столбцы напрямую, а строки str сравниваются
+по словарным кодам. Листья, которые можно ответить по индексу,
+сообщают это через access().
+"""
+import operator
+import re
+from abc import ABC, abstractmethod
+from operator import itemgetter
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from src.primitive_db.constants import (
+    ERROR_COLUMN_NOT_EXISTS,
+    ERROR_INVALID_TYPE,
+    TRUE_VALUES,
+)
+
+if TYPE_CHECKING:
+    from src.primitive_db.columnar import ColumnStore
+
+OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    '>': operator.gt,
+    '<': operator.lt,
+    '>=': operator.ge,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+
+KEYWORDS = {"and", "or", "not", "in", "between", "like"}
+
+TOKEN_PATTERN = re.compile(
+    r"""\s*(?:
+        (?P<string>'[^']*'|"[^"]*")
+      | (?P<op>[<>=!]+)
+      | (?P<punct>[(),])
+      | (?P<word>[^\s()<>=!,'"]+)
+    )""",
+    re.VERBOSE,
+)
+
+Predicate = Callable[[Dict], bool]
+
+# Предикат над позицией строки в ColumnStore
+PositionPredicate = Callable[[int], bool]
+
+# Доступ по индексу: (столбец, операция, значение)
+Access = Tuple[str, str, Any]
+
+
+class Token(NamedTuple):
+    """Лексема условия."""
+
+    kind: str
+    text: str
+
+
+def tokenize(condition: str) -> List[Token]:
+    """Разбивает условие на лексемы."""
+    tokens = []
+    position = 0
+    condition = condition.rstrip()
+    while position < len(condition):
+        match = TOKEN_PATTERN.match(condition, position)
+        if not match:
+            raise ValueError(
+                f'Некорректное условие: "{condition}" '
+                f'(позиция {position + 1})'
+            )
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == 'string':
+            text = text[1:-1]
+        elif kind == 'word' and text.lower() in KEYWORDS:
+            kind, text = 'keyword', text.lower()
+        tokens.append(Token(kind, text))
+        position = match.end()
+    return tokens
+
+
+def coerce_value(col_name: str, col_type: str, value_str: str) -> Any:
+    """Приводит литерал из условия к типу столбца."""
+    try:
+        if col_type == 'int':
+            return int(value_str)
+        elif col_type == 'bool':
+            return value_str.lower() in TRUE_VALUES
+        elif col_type == 'str':
+            if (value_str.startswith('"') and value_str.endswith('"')) \
+               or (value_str.startswith("'") and value_str.endswith("'")):
+                return value_str[1:-1]
+            return value_str
+        else:
+            raise ValueError(ERROR_INVALID_TYPE.format(col_type))
+    except ValueError:
+        raise ValueError(
+            f'Неверное значение для столбца "{col_name}" '
+            f'(тип {col_type}): "{value_str}"'
+        )
+
+
+def all_of(predicates: List[Callable[[Any], bool]]) -> Callable[[Any], bool]:
+    """Предикат "все истинны" без генератора на каждую строку."""
+    first, rest = predicates[0], predicates[1:]
+    if not rest:
+        return first
+    tail = all_of(rest)
+    return lambda record: first(record) and tail(record)
+
+
+def any_of(predicates: List[Callable[[Any], bool]]) -> Callable[[Any], bool]:
+    """Предикат "хотя бы один истинен"."""
+    first, rest = predicates[0], predicates[1:]
+    if not rest:
+        return first
+    tail = any_of(rest)
+    return lambda record: first(record) or tail(record)
+
+
+class Expr(ABC):
+    """Узел условия: predicate(record) -> bool."""
+
+    predicate: Predicate
+    # Текст условия (у корня из compile_condition): предикаты не
+    # сериализуются, и в другой процесс передаётся он
+    source: Optional[str] = None
+
+    def access(self) -> Optional[Access]:
+        """Запрос к индексу, выбирающий ровно подходящие строки."""
+        return None
+
+    @abstractmethod
+    def bind(self, store: "ColumnStore") -> PositionPredicate:
+        """Предикат над позициями строк хранилища."""
+
+
+def _never(position: int) -> bool:
+    return False
+
+
+class Compare(Expr):
+    """column op value"""
+
+    def __init__(self, column: str, op: str, value: Any) -> None:
+        self.column, self.operator, self.value = column, op, value
+        compare, get = OPERATORS[op], itemgetter(column)
+        self.predicate = lambda record: compare(get(record), value)
+
+    def access(self) -> Optional[Access]:
+        return self.column, self.operator, self.value
+
+    def bind(self, store: "ColumnStore") -> PositionPredicate:
+        column, value = store.columns[self.column], self.value
+        if self.operator in ('==', '!=') and hasattr(column, 'lookup'):
+            # Строка сравнивается по коду; её отсутствие в словаре
+            # означает, что равных строк нет
+            code, codes = column.lookup.get(value), column.codes
+            if self.operator == '==':
+                if code is None:
+                    return _never
+                return lambda position: codes[position] == code
+            if code is None:
+                return lambda position: True
+            return lambda position: codes[position] != code
+        compare, get = OPERATORS[self.operator], column.getter()
+        return lambda position: compare(get(position), value)
+
+
+class InList(Expr):
+    """column IN (v1, v2, ...)"""
+
+    def __init__(self, column: str, values: List[Any]) -> None:
+        self.column, self.values = column, frozenset(values)
+        values_set, get = self.values, itemgetter(column)
+        self.predicate = lambda record: get(record) in values_set
+
+    def access(self) -> Optional[Access]:
+        return self.column, 'in', self.values
+
+    def bind(self, store: "ColumnStore") -> PositionPredicate:
+        column = store.columns[self.column]
+        if hasattr(column, 'lookup'):
+            lookup, codes = column.lookup, column.codes
+            wanted = frozenset(
+                lookup[value] for value in self.values if value in lookup
+            )
+            return lambda position: codes[position] in wanted
+        values_set, get = self.values, column.getter()
+        return lambda position: get(position) in values_set
+
+
+class Between(Expr):
+    """column BETWEEN low AND high (границы включаются)"""
+
+    def __init__(self, column: str, low: Any, high: Any) -> None:
+        self.column, self.low, self.high = column, low, high
+        get = itemgetter(column)
+        self.predicate = lambda record: low <= get(record) <= high
+
+    def access(self) -> Optional[Access]:
+        return self.column, 'between', (self.low, self.high)
+
+    def bind(self, store: "ColumnStore") -> PositionPredicate:
+        low, high = self.low, self.high
+        get = store.columns[self.column].getter()
+        return lambda position: low <= get(position) <= high
+
+
+class Like(Expr):
+    """column LIKE pattern: % - любая подстрока, _ - один символ"""
+
+    def __init__(self, column: str, pattern: str) -> None:
+        self.column, self.pattern = column, pattern
+        self.prefix = re.split(r'[%_]', pattern, maxsplit=1)[0]
+        regex = re.compile(
+            ''.join(
+                '.*' if char == '%' else '.' if char == '_' else re.escape(char)
+                for char in pattern
+            ),
+            re.DOTALL,
+        )
+        self.match = regex.fullmatch
+        match, get = self.match, itemgetter(column)
+        self.predicate = lambda record: match(get(record)) is not None
+
+    def access(self) -> Optional[Access]:
+        # Только чистый префикс "abc%" отвечается индексом точно
+        if self.pattern == self.prefix + '%':
+            return self.column, 'prefix', self.prefix
+        return None
+
+    def bind(self, store: "ColumnStore") -> PositionPredicate:
+        # Шаблон проверяется один раз на каждую различную строку
+        column, match = store.columns[self.column], self.match
+        wanted = frozenset(
+            code for code, value in enumerate(column.dictionary)
+            if match(value) is not None
+        )
+        codes = column.codes
+        return lambda position: codes[position] in wanted
+
+
+class Not(Expr):
+    """NOT expr"""
+
+    def __init__(self, item: Expr) -> None:
+        self.item = item
+        inner = item.predicate
+        self.predicate = lambda record: not inner(record)
+
+    def bind(self, store: "ColumnStore") -> PositionPredicate:
+        inner = self.item.bind(store)
+        return lambda position: not inner(position)
+
+
+class And(Expr):
+    """expr AND expr ..."""
+
+    def __init__(self, items: List[Expr]) -> None:
+        self.items = items
+        self.predicate = all_of([item.predicate for item in items])
+
+    def bind(self, store: "ColumnStore") -> PositionPredicate:
+        return all_of([item.bind(store) for item in self.items])
+
+
+class Or(Expr):
+    """expr OR expr ..."""
+
+    def __init__(self, items: List[Expr]) -> None:
+        self.items = items
+        self.predicate = any_of([item.predicate for item in items])
+
+    def bind(self, store: "ColumnStore") -> PositionPredicate:
+        return any_of([item.bind(store) for item in self.items])
+
+
+class _Parser:
+    """Рекурсивный спуск по лексемам условия."""
+
+    def __init__(
+        self, condition: str, column_types: Dict[str, str], table_name: str
+    ) -> None:
+        self.condition = condition
+        self.tokens = tokenize(condition)
+        self.position = 0
+        self.column_types = column_types
+        self.table_name = table_name
+
+    def error(self, message: str = "") -> ValueError:
+        details = f" ({message})" if message else ""
+        return ValueError(
+            f'Некорректное условие: "{self.condition}"{details}. '
+            f'Используйте "столбец оператор значение"'
+        )
+
+    def peek(self) -> Optional[Token]:
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None
+
+    def take(self) -> Token:
+        token = self.peek()
+        if token is None:
+            raise self.error("неожиданный конец")
+        self.position += 1
+        return token
+
+    def accept(self, kind: str, text: Optional[str] = None) -> bool:
+        token = self.peek()
+        if token and token.kind == kind and text in (None, token.text):
+            self.position += 1
+            return True
+        return False
+
+    def expect(self, kind: str, text: str) -> None:
+        if not self.accept(kind, text):
+            raise self.error(f'ожидалось "{text}"')
+
+    def parse(self) -> Expr:
+        if not self.tokens:
+            raise self.error()
+        expr = self.parse_or()
+        if self.peek() is not None:
+            raise self.error(f'лишнее "{self.peek().text}"')
+        return expr
+
+    def parse_or(self) -> Expr:
+        items = [self.parse_and()]
+        while self.accept('keyword', 'or'):
+            items.append(self.parse_and())
+        return items[0] if len(items) == 1 else Or(items)
+
+    def parse_and(self) -> Expr:
+        items = [self.parse_not()]
+        while self.accept('keyword', 'and'):
+            items.append(self.parse_not())
+        return items[0] if len(items) == 1 else And(items)
+
+    def parse_not(self) -> Expr:
+        if self.accept('keyword', 'not'):
+            return Not(self.parse_not())
+        if self.accept('punct', '('):
+            expr = self.parse_or()
+            self.expect('punct', ')')
+            return expr
+        return self.parse_predicate()
+
+    def parse_value(self, column: str) -> Any:
+        token = self.take()
+        if token.kind not in ('word', 'string', 'keyword'):
+            raise self.error(f'ожидалось значение, получено "{token.text}"')
+        col_type = self.column_types[column]
+        if token.kind == 'string' and col_type == 'str':
+            return token.text
+        return coerce_value(column, col_type, token.text)
+
+    def parse_predicate(self) -> Expr:
+        token = self.take()
+        if token.kind != 'word':
+            raise self.error(f'ожидался столбец, получено "{token.text}"')
+        column = token.text
+        if column not in self.column_types:
+            raise ValueError(
+                ERROR_COLUMN_NOT_EXISTS.format(column, self.table_name)
+            )
+
+        token = self.take()
+        if token.kind == 'op':
+            if token.text not in OPERATORS:
+                raise ValueError(
+                    f'Неподдерживаемый оператор: "{token.text}"'
+                )
+            return Compare(column, token.text, self.parse_value(column))
+
+        negate = False
+        if token == Token('keyword', 'not'):
+            negate = True
+            token = self.take()
+
+        if token == Token('keyword', 'in'):
+            self.expect('punct', '(')
+            values = [self.parse_value(column)]
+            while self.accept('punct', ','):
+                values.append(self.parse_value(column))
+            self.expect('punct', ')')
+            expr = InList(column, values)
+        elif token == Token('keyword', 'between'):
+            low = self.parse_value(column)
+            self.expect('keyword', 'and')
+            expr = Between(column, low, self.parse_value(column))
+        elif token == Token('keyword', 'like'):
+            if self.column_types[column] != 'str':
+                raise self.error(f'LIKE применим только к str: "{column}"')
+            expr = Like(column, self.parse_value(column))
+        else:
+            raise self.error(f'неожиданное "{token.text}"')
+
+        return Not(expr) if negate else expr
+
+
+def condition_key(condition: str) -> Tuple[Token, ...]:
+    """Условие как кортеж лексем: ключ кэша, не зависящий от пробелов."""
+    return tuple(tokenize(condition))
+
+
+def compile_condition(
+    condition: str, column_types: Dict[str, str], table_name: str
+) -> Expr:
+    """Разбирает условие WHERE по схеме таблицы."""
+    expr = _Parser(condition, column_types, table_name).parse()
+    expr.source = condition
+    return expr
+
+
+def conjuncts(expr: Expr) -> List[Expr]:
+    """Слагаемые верхнего уровня AND."""
+    if isinstance(expr, And):
+        return [item for part in expr.items for item in conjuncts(part)]
+    return [expr]
+
+
+def columns(expr: Expr) -> Set[str]:
+    """Столбцы, которые читает условие."""
+    if isinstance(expr, Not):
+        return columns(expr.item)
+    if isinstance(expr, (And, Or)):
+        return set().union(*(columns(item) for item in expr.items))
+    return {expr.column}
+
+
+def rename(expr: Expr, mapping: Dict[str, str]) -> Expr:
+    """Копия условия, в которой столбцы переименованы по mapping."""
+    if isinstance(expr, Not):
+        return Not(rename(expr.item, mapping))
+    if isinstance(expr, (And, Or)):
+        return type(expr)([rename(item, mapping) for item in expr.items])
+    column = mapping.get(expr.column, expr.column)
+    if isinstance(expr, Compare):
+        return Compare(column, expr.operator, expr.value)
+    if isinstance(expr, InList):
+        return InList(column, list(expr.values))
+    if isinstance(expr, Between):
+        return Between(column, expr.low, expr.high)
+    return Like(column, expr.pattern)
@@ -7,11 +7,68 @@
 METADATA_FILE = "db_meta.json"
 DATA_DIR = "data"
 
-# Поддерживаемые типы данных
-SUPPORTED_TYPES = {"int", "str", "bool"}
+# Файлы строк таблицы: бинарный сегмент (основной) или json (старый)
+SEGMENT_EXTENSION = ".seg"
+TABLE_FILE_EXTENSIONS = (".seg", ".json")
 
-# Операторы сравнения для WHERE условий
-COMPARISON_OPERATORS = {">", "<", ">=", "<=", "==", "!="}
+# Сетевой режим (project serve): адрес по умолчанию
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8765
+
+# Фоновая запись: изменения копятся не дольше FLUSH_MAX_DELAY секунд и
+# пишутся одной пачкой; 0 - писать сразу при каждом сохранении
+FLUSH_MAX_DELAY = 0.0
+
+# Журнал изменений: контрольная точка, когда в журнале больше операций,
+# чем max(порог, число строк таблицы)
+WAL_CHECKPOINT_MIN_OPS = 1000
+
+# Уплотнение таблицы: когда пустых слотов после удалений больше, чем
+# max(порог, число живых строк)
+COMPACT_MIN_DEAD = 1000
+
+# Записей на страницу при выводе select в консоль
+PAGE_SIZE = 50
+
+# Кэш select: суммарно не больше CACHE_MAX_ROWS строк (позиций) во всех
+# записях, больший результат не кэшируется
+CACHE_MAX_ROWS = 10000
+
+# Вывод таблиц: ширины столбцов считаются по первым RENDER_SAMPLE_ROWS
+# строкам, ячейки длиннее MAX_CELL_WIDTH обрезаются
+RENDER_SAMPLE_ROWS = 100
+MAX_CELL_WIDTH = 40
+
+# Размер пакета при массовой загрузке: проверка и запись на диск
+# выполняются по пакетам
+COPY_BATCH_SIZE = 10000
+
+# С какого размера таблицы условие считается на NumPy (если установлен)
+VECTORIZE_MIN_ROWS = 10000
+
+# Параллельный скан в пуле процессов, если NumPy не справился: разделов
+# SCAN_PARTITIONS (0 - по числу ядер), таблицы меньше PARALLEL_MIN_ROWS
+# сканируются в одном процессе
+SCAN_PARTITIONS = 0
+PARALLEL_MIN_ROWS = 200000
+
+# Команды, меняющие базу: выполняются под исключительной блокировкой
+# (copy - только в направлении from)
+WRITE_COMMANDS = {
+    "create_table", "drop_table", "insert", "update", "delete",
+    "copy", "create_index", "drop_index", "begin", "commit", "rollback",
+}
+
+# Управление транзакцией
+TRANSACTION_COMMANDS = {"begin", "commit", "rollback"}
+
+# Виды индексов: hash для ==, !=, IN; sorted для ==, <, <=, >, >=, IN,
+# BETWEEN и LIKE 'префикс%'
+INDEX_KINDS = {"hash", "sorted"}
+
+# Агрегатные функции; sum и avg только для int и bool
+AGGREGATE_FUNCTIONS = {"count", "sum", "min", "max", "avg"}
+NUMERIC_AGGREGATES = {"sum", "avg"}
 
 # Булевые значения
 TRUE_VALUES = {"true", "1", "yes", "да"}
@@ -25,4 +82,14 @@ ERROR_TABLE_EXISTS = 'Таблица "{}" уже существует.'
 ERROR_TABLE_NOT_EXISTS = 'Таблица "{}" не существует.'
 ERROR_COLUMN_NOT_EXISTS = 'Столбец "{}" не существует в таблице "{}".'
 ERROR_INVALID_TYPE = 'Неверный тип данных: "{}". Поддерживаемые типы: int, str, bool.'
+ERROR_INVALID_INDEX = 'Неверный вид индекса: "{}". Поддерживаемые: hash, sorted.'
+ERROR_INDEX_EXISTS = 'Индекс по столбцу "{}" в таблице "{}" уже существует.'
+ERROR_INDEX_NOT_EXISTS = 'Индекса по столбцу "{}" в таблице "{}" нет.'
+ERROR_INVALID_AGGREGATE = (
+    'Неверная агрегатная функция: "{}". '
+    'Поддерживаемые: count, sum, min, max, avg.'
+)
 ERROR_INVALID_FORMAT = 'Некорректный формат: "{}". Используйте "{}".'
+ERROR_ID_READONLY = 'Столбец "ID" - первичный ключ, его нельзя изменить.'
+ERROR_WRITE_FAILED = 'Не удалось сохранить изменения на диск: {}'
+ERROR_JOIN_TYPES = 'Столбцы соединения "{}" ({}) и "{}" ({}) разных типов.'
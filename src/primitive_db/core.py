@@ -1,16 +1,47 @@
 #!/usr/bin/env python3
-import re
-from typing import Any, Dict, List
+from collections import Counter
+from itertools import islice
+from operator import add, itemgetter
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
 
+from src.primitive_db import parallel, vectorized
+from src.primitive_db.columnar import INT64_MAX, INT64_MIN
+from src.primitive_db.conditions import (
+    And,
+    Expr,
+    compile_condition,
+    condition_key,
+    conjuncts,
+    rename,
+)
+from src.primitive_db.conditions import columns as condition_columns
 from src.primitive_db.constants import (
+    AGGREGATE_FUNCTIONS,
     AUTO_ID_COLUMN,
-    COMPARISON_OPERATORS,
+    CACHE_MAX_ROWS,
+    COPY_BATCH_SIZE,
     ERROR_COLUMN_NOT_EXISTS,
+    ERROR_ID_READONLY,
+    ERROR_INDEX_EXISTS,
+    ERROR_INDEX_NOT_EXISTS,
+    ERROR_INVALID_AGGREGATE,
     ERROR_INVALID_FORMAT,
-    ERROR_INVALID_TYPE,
+    ERROR_INVALID_INDEX,
+    ERROR_JOIN_TYPES,
     ERROR_TABLE_EXISTS,
     ERROR_TABLE_NOT_EXISTS,
     FALSE_VALUES,
+    INDEX_KINDS,
+    NUMERIC_AGGREGATES,
     TRUE_VALUES,
 )
 from src.primitive_db.decorators import (
@@ -19,14 +50,21 @@ from src.primitive_db.decorators import (
     handle_db_errors,
     log_time,
 )
-from src.primitive_db.utils import validate_column_definition
+from src.primitive_db.planner import iter_positions, matching_positions
+from src.primitive_db.table import ID, Table
+from src.primitive_db.utils import (
+    copy_format,
+    read_rows,
+    validate_column_definition,
+    write_rows,
+)
 
 
 @handle_db_errors
 @log_time
 def create_table(
-    metadata: Dict[str, Any], table_name: str, columns: List[str]
-) -> Dict[str, Any]:
+    metadata: Dict[str, Table], table_name: str, columns: List[str]
+) -> Dict[str, Table]:
     """Создает новую таблицу с указанными столбцами"""
     if table_name in metadata:
         raise ValueError(ERROR_TABLE_EXISTS.format(table_name))
@@ -47,10 +85,7 @@ def create_table(
         col_name, col_type = result
         validated_columns.append((col_name, col_type))
     
-    metadata[table_name] = {
-        'columns': validated_columns,
-        'data': []
-    }
+    metadata[table_name] = Table(table_name, validated_columns)
     
     column_list = ', '.join(
         [f'{name}:{type}' for name, type in validated_columns]
@@ -67,21 +102,24 @@ def create_table(
 @confirm_action("удалить таблицу")
 @log_time
 def drop_table(
-    metadata: Dict[str, Any], table_name: str
-) -> Dict[str, Any]:
+    metadata: Dict[str, Table], table_name: str
+) -> Dict[str, Table]:
     """Удаляет таблицу из базы данных."""
 
     if table_name not in metadata:
         raise ValueError(ERROR_TABLE_NOT_EXISTS.format(table_name))
     
     del metadata[table_name]
+    select_records.invalidate(table_name)
+    _select_positions.invalidate(table_name)
+    parallel.forget(table_name)
     print(f'Таблица "{table_name}" успешно удалена.')
     
     return metadata
 
 
 @log_time
-def list_tables(metadata: Dict[str, Any]) -> None:
+def list_tables(metadata: Dict[str, Table]) -> None:
     """Выводит список всех таблиц в базе данных."""
 
     if not metadata:
@@ -94,26 +132,75 @@ def list_tables(metadata: Dict[str, Any]) -> None:
 
 
 def get_table_info(
-    metadata: Dict[str, Any], table_name: str
-) -> Dict[str, Any] | None:
+    metadata: Dict[str, Table], table_name: str
+) -> Table | None:
     """Получает информацию о таблице."""
 
     return metadata.get(table_name)
 
 
+def _parse_int(value: Any) -> int:
+    if isinstance(value, (bool, float)):
+        raise ValueError(value)
+    number = int(value)
+    if not INT64_MIN <= number <= INT64_MAX:
+        raise ValueError(value)
+    return number
+
+
+def _parse_bool(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    lowered = str(value).strip().lower()
+    if lowered in TRUE_VALUES:
+        return True
+    if lowered in FALSE_VALUES:
+        return False
+    raise ValueError(value)
+
+
+def _parse_str(value: Any) -> str:
+    if not isinstance(value, str):
+        raise ValueError(value)
+    return value
+
+
+# Тип столбца -> разбор входного значения (строки из команды или csv,
+# либо уже типизированного значения из JSON)
+VALUE_PARSERS: Dict[str, Callable[[Any], Any]] = {
+    'int': _parse_int,
+    'bool': _parse_bool,
+    'str': _parse_str,
+}
+
+
+def _parse_value(col_name: str, col_type: str, col_value: str) -> Any:
+    """Значение столбца из команды: кавычки у str снимаются."""
+    if col_type == 'str' and len(col_value) >= 2 \
+       and col_value[0] == col_value[-1] and col_value[0] in "'\"":
+        col_value = col_value[1:-1]
+    try:
+        return VALUE_PARSERS[col_type](col_value)
+    except (ValueError, TypeError):
+        raise ValueError(
+            f'Неверное значение для столбца "{col_name}" '
+            f'(тип {col_type}): "{col_value}"'
+        )
+
+
 @handle_db_errors
 @log_time
-@cache_results(max_size=50)
 def insert_record(
-    metadata: Dict[str, Any], table_name: str, values: List[str]
-) -> Dict[str, Any]:
+    metadata: Dict[str, Table], table_name: str, values: List[str]
+) -> Dict[str, Table]:
     """Добавляет новую запись в таблицу."""
 
     if table_name not in metadata:
         raise ValueError(ERROR_TABLE_NOT_EXISTS.format(table_name))
     
-    table_info = metadata[table_name]
-    columns = table_info['columns'][1:]  # Пропускаем ID столбец
+    table = metadata[table_name]
+    columns = table.columns[1:]  # Пропускаем ID столбец
+    column_types = dict(columns)
     
     record = {}
     for value_str in values:
@@ -126,44 +213,14 @@ def insert_record(
         col_name = col_name.strip()
         col_value = col_value.strip()
         
-        column_def = None
-        for col_def_name, col_type in columns:
-            if col_def_name == col_name:
-                column_def = (col_def_name, col_type)
-                break
-        
-        if not column_def:
+        if col_name not in column_types:
             raise ValueError(
                 ERROR_COLUMN_NOT_EXISTS.format(col_name, table_name)
             )
         
-        col_name, col_type = column_def
-        try:
-            if col_type == 'int':
-                record[col_name] = int(col_value)
-            elif col_type == 'bool':
-                col_value_lower = col_value.lower()
-                if col_value_lower in TRUE_VALUES:
-                    record[col_name] = True
-                elif col_value_lower in FALSE_VALUES:
-                    record[col_name] = False
-                else:
-                    raise ValueError(
-                        f'Неверное значение для bool: "{col_value}"'
-                    )
-            elif col_type == 'str':
-                if (col_value.startswith('"') and col_value.endswith('"')) \
-                   or (col_value.startswith("'") and col_value.endswith("'")):
-                    record[col_name] = col_value[1:-1]
-                else:
-                    record[col_name] = col_value
-            else:
-                raise ValueError(ERROR_INVALID_TYPE.format(col_type))
-        except ValueError:
-            raise ValueError(
-                f'Неверное значение для столбца "{col_name}" '
-                f'(тип {col_type}): "{col_value}"'
-            )
+        record[col_name] = _parse_value(
+            col_name, column_types[col_name], col_value
+        )
     
     for col_name, col_type in columns:
         if col_name not in record:
@@ -171,125 +228,627 @@ def insert_record(
                 f'Отсутствует значение для обязательного столбца: "{col_name}"'
             )
     
-    existing_data = table_info.get('data', [])
-    if existing_data:
-        last_id = max([r.get('ID', 0) for r in existing_data])
-        new_id = last_id + 1
-    else:
-        new_id = 1
-    
+    new_id = table.next_id()
     complete_record = {'ID': new_id}
     complete_record.update(record)
     
-    if 'data' not in table_info:
-        table_info['data'] = []
-    
-    table_info['data'].append(complete_record)
-    metadata[table_name] = table_info
+    table.insert(complete_record)
     
     print(f'Запись добавлена в таблицу "{table_name}" с ID={new_id}')
     return metadata
 
 
+def _batch_error(
+    batch: List[Dict], first_number: int, name: str, parse: Callable
+) -> ValueError:
+    """Ошибка для первой строки пакета, где столбец name не разбирается."""
+    for number, record in enumerate(batch, first_number):
+        if name not in record:
+            return ValueError(
+                f'Строка {number}: отсутствует значение для столбца "{name}"'
+            )
+        try:
+            parse(record[name])
+        except (ValueError, TypeError):
+            return ValueError(
+                f'Строка {number}: неверное значение для столбца '
+                f'"{name}": "{record[name]}"'
+            )
+    return ValueError(f'Неверное значение для столбца "{name}"')
+
+
+def _insert_batches(
+    table: Table,
+    records: Iterable[Dict],
+    persist: Optional[Callable[[], None]] = None,
+    batch_size: int = COPY_BATCH_SIZE,
+) -> int:
+    """Проверяет и вставляет записи пакетами, возвращает их число.
+
+    Пакет разбирается по столбцам и либо вставляется целиком, либо не
+    вставляется; после каждого пакета вызывается persist. Столбец ID во
+    входных данных игнорируется: записи получают новые ID подряд.
+    """
+    columns = table.columns[1:]
+    names = [name for name, _ in columns]
+    row_names = [ID, *names]
+    parsers = [VALUE_PARSERS[col_type] for _, col_type in columns]
+    known = set(table.column_types())
+    records = iter(records)
+    total = 0
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            return total
+        try:
+            unknown = set().union(*batch) - known
+            if unknown:
+                raise ValueError(
+                    f'Лишние столбцы: {", ".join(sorted(map(str, unknown)))}'
+                )
+            values = []
+            for name, parse in zip(names, parsers):
+                try:
+                    values.append(list(map(parse, map(itemgetter(name), batch))))
+                except (KeyError, ValueError, TypeError):
+                    raise _batch_error(batch, total + 1, name, parse)
+        except ValueError as e:
+            raise ValueError(f"{e}. Загружено записей: {total}")
+
+        ids = table.allocate_ids(len(batch))
+        table.insert_many([dict(zip(row_names, row)) for row in zip(ids, *values)])
+        total += len(batch)
+        if persist:
+            persist()
+
+
+@handle_db_errors
+@log_time
+def insert_many(
+    metadata: Dict[str, Table],
+    table_name: str,
+    records: Iterable[Dict],
+    persist: Optional[Callable[[], None]] = None,
+) -> int:
+    """Добавляет много записей сразу, проверяя их пакетами."""
+    if table_name not in metadata:
+        raise ValueError(ERROR_TABLE_NOT_EXISTS.format(table_name))
+
+    return _insert_batches(metadata[table_name], records, persist)
+
+
+@handle_db_errors
+@log_time
+def copy_from(
+    metadata: Dict[str, Table],
+    table_name: str,
+    filepath: str,
+    persist: Optional[Callable[[], None]] = None,
+) -> Dict[str, Table]:
+    """Загружает записи в таблицу из csv или JSON Lines файла."""
+    if table_name not in metadata:
+        raise ValueError(ERROR_TABLE_NOT_EXISTS.format(table_name))
+
+    count = _insert_batches(metadata[table_name], read_rows(filepath), persist)
+    print(f'Загружено {count} записей в таблицу "{table_name}" из {filepath}')
+    return metadata
+
+
 @handle_db_errors
 @log_time
-def select_records(
-    metadata: Dict[str, Any], table_name: str, condition: str = None
-) -> List[Dict]:
-    """Выбирает записи из таблицы с опциональным условием."""
+def copy_to(
+    metadata: Dict[str, Table],
+    table_name: str,
+    filepath: str,
+    file_format: Optional[str] = None,
+    condition: str = None,
+) -> int:
+    """Выгружает записи таблицы в csv или JSON Lines потоком.
 
+    Позиции подходящих строк и сами строки идут генераторами прямо в
+    буферизованный файл, поэтому память не растёт с размером таблицы.
+    """
     if table_name not in metadata:
         raise ValueError(ERROR_TABLE_NOT_EXISTS.format(table_name))
-    
-    table_info = metadata[table_name]
-    records = table_info.get('data', [])
-    
+
+    table = metadata[table_name]
+    file_format = file_format or copy_format(filepath)
+    positions = _iter_matching(table, condition)
+
+    columns = [name for name, _ in table.columns]
+    count = write_rows(filepath, columns, map(table.row, positions), file_format)
+    print(f'Выгружено {count} записей из таблицы "{table_name}" в {filepath}')
+    return count
+
+
+def _condition_cache_key(condition: Optional[str]) -> Optional[Tuple]:
+    """Разобранное условие для ключа кэша или None, если не разбирается."""
+    if not condition:
+        return None
+    try:
+        return condition_key(condition)
+    except ValueError:
+        return None
+
+
+def _positions_cache_key(table: Table, condition: str) -> Optional[Tuple]:
+    """Ключ кэша позиций: таблица, условие и версия таблицы.
+
+    Без условия позиции - просто все живые строки, их не кэшируем.
+    """
+    normalized = _condition_cache_key(condition)
+    if normalized is None:
+        return None
+    return table.name, normalized, table.version
+
+
+def _matching_positions(table: Table, condition: str) -> List[int]:
+    """Позиции строк, подходящих под условие: по индексу или сканом."""
     if not condition:
-        return records
+        return list(table.positions())
     
-    match = re.match(r'(\w+)([<>=!]+)(.+)', condition)
-    if not match:
-        raise ValueError(
-            f'Некорректное условие: "{condition}". '
-            f'Используйте "столбец оператор значение"'
-        )
+    expr = compile_condition(condition, table.column_types(), table.name)
+    return matching_positions(table, expr)
+
+
+def _iter_matching(table: Table, condition: str) -> Iterator[int]:
+    """Позиции подходящих строк по одной, без сбора списка."""
+    if not condition:
+        return table.positions()
     
-    col_name, operator, value_str = match.groups()
+    expr = compile_condition(condition, table.column_types(), table.name)
+    return iter_positions(table, expr)
+
+
+@cache_results(
+    max_size=50, key=_positions_cache_key, max_items=CACHE_MAX_ROWS, stream=True
+)
+def _select_positions(table: Table, condition: str) -> Iterator[int]:
+    """Позиции для select без limit, потоком.
+
+    Небольшой результат, дочитанный до конца, кэшируется по версии
+    таблицы: повтор запроса не сканирует заново.
+    """
+    return _iter_matching(table, condition)
+
+
+@handle_db_errors
+def iter_records(
+    metadata: Dict[str, Table],
+    table_name: str,
+    condition: str = None,
+    columns: Optional[List[str]] = None,
+    limit: Optional[int] = None,
+    offset: int = 0,
+) -> Iterator[Dict]:
+    """Записи таблицы потоком: скан -> фильтр -> проекция -> limit.
+
+    Строки сканируются лениво; с limit скан останавливается на
+    offset + limit подходящей строке.
+    """
+    if table_name not in metadata:
+        raise ValueError(ERROR_TABLE_NOT_EXISTS.format(table_name))
     
-    if operator not in COMPARISON_OPERATORS:
-        raise ValueError(f'Неподдерживаемый оператор: "{operator}"')
+    table = metadata[table_name]
+    column_types = table.column_types()
+    for column in columns or []:
+        if column not in column_types:
+            raise ValueError(ERROR_COLUMN_NOT_EXISTS.format(column, table_name))
     
-    column_types = {name: type for name, type in table_info['columns']}
-    if col_name not in column_types:
-        raise ValueError(
-            ERROR_COLUMN_NOT_EXISTS.format(col_name, table_name)
-        )
+    if limit is None:
+        positions = _select_positions(table, condition)
+    else:
+        positions = _iter_matching(table, condition)
+    stop = None if limit is None else offset + limit
+    return map(table.row_reader(columns), islice(positions, offset, stop))
+
+
+def _select_cache_key(
+    metadata: Dict[str, Table],
+    table_name: str,
+    condition: str = None,
+    columns: Optional[List[str]] = None,
+    limit: Optional[int] = None,
+    offset: int = 0,
+) -> Optional[Tuple]:
+    """Ключ кэша select: таблица, запрос и текущая версия таблицы."""
+    table = metadata.get(table_name)
+    if table is None:
+        return None
+    normalized = _condition_cache_key(condition)
+    if condition and normalized is None:
+        return None
+    query = (normalized, tuple(columns or ()), limit, offset)
+    return table_name, query, table.version
+
+
+@handle_db_errors
+@log_time
+@cache_results(max_size=50, key=_select_cache_key, max_items=CACHE_MAX_ROWS)
+def select_records(
+    metadata: Dict[str, Table],
+    table_name: str,
+    condition: str = None,
+    columns: Optional[List[str]] = None,
+    limit: Optional[int] = None,
+    offset: int = 0,
+) -> List[Dict]:
+    """Выбирает записи из таблицы с опциональным условием."""
+
+    if table_name not in metadata:
+        raise ValueError(ERROR_TABLE_NOT_EXISTS.format(table_name))
     
-    col_type = column_types[col_name]
+    if not condition and columns is None and limit is None and not offset:
+        return metadata[table_name].rows
     
-    try:
-        if col_type == 'int':
-            value = int(value_str)
-        elif col_type == 'bool':
-            value_lower = value_str.lower()
-            value = value_lower in TRUE_VALUES
-        elif col_type == 'str':
-            if (value_str.startswith('"') and value_str.endswith('"')) \
-               or (value_str.startswith("'") and value_str.endswith("'")):
-                value = value_str[1:-1]
-            else:
-                value = value_str
+    return list(
+        iter_records(metadata, table_name, condition, columns, limit, offset)
+    )
+
+
+def aggregate_label(func: str, column: Optional[str]) -> str:
+    """Заголовок столбца результата: count(*), avg(age)."""
+    return f"{func}({column or '*'})"
+
+
+# Шаг накопления для агрегата; avg копит сумму и делится в конце
+_AGGREGATE_STEPS = {"sum": add, "avg": add, "min": min, "max": max}
+
+
+def _aggregate_from_index(
+    table: Table, aggregates: List[Tuple[str, Optional[str]]]
+) -> Optional[List[Any]]:
+    """count/min/max всей таблицы по статистике и индексам или None."""
+    results = []
+    for func, column in aggregates:
+        if func == "count":
+            results.append(table.row_count)
+        elif func in ("min", "max"):
+            bounds = table.column_range(column)
+            if bounds is None:
+                return None
+            results.append(bounds[0] if func == "min" else bounds[1])
         else:
-            raise ValueError(ERROR_INVALID_TYPE.format(col_type))
-    except ValueError:
-        raise ValueError(
-            f'Неверное значение для столбца "{col_name}" '
-            f'(тип {col_type}): "{value_str}"'
-        )
-    
-    filtered_records = []
-    for record in records:
-        record_value = record.get(col_name)
-        
-        if col_name not in record:
+            return None
+    return results
+
+
+def _aggregate_groups(
+    table: Table,
+    positions: List[int],
+    aggregates: List[Tuple[str, Optional[str]]],
+    group_by: List[str],
+) -> Dict[Tuple, List[Any]]:
+    """Один проход по строкам: ключ группы -> [count, накопители...].
+
+    Первая строка группы сразу становится начальным значением
+    накопителей, поэтому min/max не нужен особый "пустой" случай.
+    """
+    store = table.store
+    key_getters = [store.columns[column].getter() for column in group_by]
+    steps = [
+        (_AGGREGATE_STEPS[func], store.columns[column].getter())
+        for func, column in aggregates if func != "count"
+    ]
+    groups: Dict[Tuple, List[Any]] = {}
+    for position in positions:
+        key = tuple(get(position) for get in key_getters)
+        state = groups.get(key)
+        if state is None:
+            groups[key] = [1] + [get(position) for _, get in steps]
             continue
-            
-        match_condition = False
-        if operator == '>':
-            match_condition = record_value > value
-        elif operator == '<':
-            match_condition = record_value < value
-        elif operator == '>=':
-            match_condition = record_value >= value
-        elif operator == '<=':
-            match_condition = record_value <= value
-        elif operator == '==':
-            match_condition = record_value == value
-        elif operator == '!=':
-            match_condition = record_value != value
-        
-        if match_condition:
-            filtered_records.append(record)
-    
-    return filtered_records
+        state[0] += 1
+        for slot, (step, get) in enumerate(steps, 1):
+            state[slot] = step(state[slot], get(position))
+    return groups
+
+
+def _aggregate_results(
+    state: List[Any], aggregates: List[Tuple[str, Optional[str]]]
+) -> List[Any]:
+    """Итоговые значения агрегатов группы из её накопителей."""
+    count, accumulators = state[0], iter(state[1:])
+    results = []
+    for func, _ in aggregates:
+        if func == "count":
+            results.append(count)
+        elif func == "avg":
+            results.append(next(accumulators) / count)
+        else:
+            results.append(next(accumulators))
+    return results
+
+
+@handle_db_errors
+@log_time
+def aggregate_records(
+    metadata: Dict[str, Table],
+    table_name: str,
+    aggregates: List[Tuple[str, Optional[str]]],
+    group_by: Optional[List[str]] = None,
+    condition: str = None,
+) -> List[Dict]:
+    """Считает агрегаты по строкам таблицы с группировкой и условием.
+
+    Без группировки и условия count/min/max берутся из статистики и
+    индексов, иначе строки обходятся один раз.
+    """
+    if table_name not in metadata:
+        raise ValueError(ERROR_TABLE_NOT_EXISTS.format(table_name))
+
+    table = metadata[table_name]
+    column_types = table.column_types()
+    group_by = group_by or []
+
+    for func, column in aggregates:
+        if func not in AGGREGATE_FUNCTIONS:
+            raise ValueError(ERROR_INVALID_AGGREGATE.format(func))
+        if column is None and func != "count":
+            raise ValueError(
+                f'Функция {func} требует столбец: {func}(<столбец>)'
+            )
+        if column is not None and column not in column_types:
+            raise ValueError(ERROR_COLUMN_NOT_EXISTS.format(column, table_name))
+        if func in NUMERIC_AGGREGATES and column_types[column] == 'str':
+            raise ValueError(
+                f'Функция {func} неприменима к столбцу str: "{column}"'
+            )
+    for column in group_by:
+        if column not in column_types:
+            raise ValueError(ERROR_COLUMN_NOT_EXISTS.format(column, table_name))
+
+    labels = [aggregate_label(func, column) for func, column in aggregates]
+
+    if not group_by:
+        results = None
+        if not condition:
+            results = _aggregate_from_index(table, aggregates)
+        if results is None:
+            positions = _matching_positions(table, condition)
+            results = vectorized.aggregate(table.store, positions, aggregates)
+            if results is None:
+                groups = _aggregate_groups(table, positions, aggregates, [])
+                if groups:
+                    results = _aggregate_results(groups[()], aggregates)
+                else:
+                    results = [
+                        0 if func in ("count", "sum") else None
+                        for func, _ in aggregates
+                    ]
+        return [dict(zip(labels, results))]
+
+    positions = _matching_positions(table, condition)
+    groups = _aggregate_groups(table, positions, aggregates, group_by)
+    return [
+        dict(zip(group_by + labels, [*key, *_aggregate_results(state, aggregates)]))
+        for key, state in sorted(groups.items())
+    ]
+
+
+def _join_names(tables: List[Table]) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """Имена столбцов соединения: имя -> "таблица.столбец" и имя -> тип.
+
+    Без имени таблицы можно назвать столбец, который есть только в
+    одной из таблиц.
+    """
+    owners = Counter(name for table in tables for name, _ in table.columns)
+    qualified, types = {}, {}
+    for table in tables:
+        for name, col_type in table.columns:
+            full = f"{table.name}.{name}"
+            qualified[full], types[full] = full, col_type
+            if owners[name] == 1:
+                qualified[name], types[name] = full, col_type
+    return qualified, types
+
+
+def _split_join_condition(
+    expr: Expr, table_names: List[str]
+) -> Tuple[Dict[str, Optional[Expr]], Optional[Expr]]:
+    """Слагаемые AND по одной таблице (в её именах) и остаток.
+
+    Слагаемые по одной таблице проверяются при её скане, остаток - на
+    соединённых строках.
+    """
+    sides = {table_name: [] for table_name in table_names}
+    residual = []
+    for part in conjuncts(expr):
+        names = condition_columns(part)
+        owners = {name.partition(".")[0] for name in names}
+        if len(owners) != 1:
+            residual.append(part)
+            continue
+        bare = {name: name.partition(".")[2] for name in names}
+        sides[owners.pop()].append(rename(part, bare))
+
+    def combine(parts: List[Expr]) -> Optional[Expr]:
+        if not parts:
+            return None
+        return parts[0] if len(parts) == 1 else And(parts)
+
+    filters = {table_name: combine(parts) for table_name, parts in sides.items()}
+    return filters, combine(residual)
+
+
+def _join_build(
+    table: Table, column: str, expr: Optional[Expr], indexed: bool
+) -> Callable[[Any], Iterable[int]]:
+    """Поиск значение -> позиции строк стороны построения.
+
+    С индексом по столбцу (или по ID) поиск идёт в нём, и фильтр
+    стороны проверяется на найденных строках; иначе строится
+    хеш-таблица по строкам, прошедшим фильтр.
+    """
+    if indexed:
+        accept = expr.bind(table.store) if expr is not None else None
+
+        def find(value: Any) -> Iterable[int]:
+            positions = table.lookup(column, "==", value)
+            if accept is None:
+                return positions
+            return [position for position in positions if accept(position)]
+        return find
+
+    if expr is None:
+        positions = table.positions()
+    else:
+        positions = matching_positions(table, expr)
+    get = table.store.columns[column].getter()
+    buckets: Dict[Any, List[int]] = {}
+    for position in positions:
+        key = get(position)
+        bucket = buckets.get(key)
+        if bucket is None:
+            buckets[key] = [position]
+        else:
+            bucket.append(position)
+    return lambda value: buckets.get(value, ())
+
+
+def _join_getters(
+    table: Table, names: List[str]
+) -> List[Tuple[str, Callable[[int], Any]]]:
+    """Пары "таблица.столбец" -> чтение значения по позиции."""
+    store = table.store
+    prefix = f"{table.name}."
+    return [
+        (name, store.columns[name[len(prefix):]].getter())
+        for name in names if name.startswith(prefix)
+    ]
+
+
+@handle_db_errors
+def join_records(
+    metadata: Dict[str, Table],
+    left: str,
+    right: str,
+    left_column: str,
+    right_column: str,
+    columns: Optional[List[str]] = None,
+    condition: str = None,
+    limit: Optional[int] = None,
+    offset: int = 0,
+) -> Tuple[List[str], Iterator[Dict]]:
+    """Соединение двух таблиц по равенству столбцов (hash join).
+
+    Хеш-таблица строится по меньшей таблице (по числу строк из
+    каталога), а бо́льшая сканируется потоком и ищет в ней пары. Индекс
+    по столбцу соединения (или ID) заменяет хеш-таблицу; индекс большей
+    таблицы меняет стороны местами. Слагаемые WHERE по одной таблице
+    проверяются при её скане, остальные - на соединённых строках.
+
+    Возвращает столбцы результата ("таблица.столбец") и записи потоком.
+    """
+    for table_name in (left, right):
+        if table_name not in metadata:
+            raise ValueError(ERROR_TABLE_NOT_EXISTS.format(table_name))
+
+    tables = {left: metadata[left], right: metadata[right]}
+    join_on = {left: left_column, right: right_column}
+    qualified, types = _join_names(list(tables.values()))
+    for table_name, column in join_on.items():
+        if column not in tables[table_name].column_types():
+            raise ValueError(ERROR_COLUMN_NOT_EXISTS.format(column, table_name))
+    left_key, right_key = f"{left}.{left_column}", f"{right}.{right_column}"
+    if types[left_key] != types[right_key]:
+        raise ValueError(ERROR_JOIN_TYPES.format(
+            left_key, types[left_key], right_key, types[right_key]
+        ))
+
+    label = f"{left} join {right}"
+    for column in columns or []:
+        if column in qualified:
+            continue
+        if all(column in table.column_types() for table in tables.values()):
+            raise ValueError(
+                f'Столбец "{column}" есть в обеих таблицах: '
+                f'укажите "<таблица>.{column}"'
+            )
+        raise ValueError(ERROR_COLUMN_NOT_EXISTS.format(column, label))
+    if columns:
+        output = [qualified[column] for column in columns]
+    else:
+        output = [
+            f"{table_name}.{name}"
+            for table_name, table in tables.items()
+            for name, _ in table.columns
+        ]
+
+    filters, residual = {left: None, right: None}, None
+    if condition:
+        expr = compile_condition(condition, types, label)
+        filters, residual = _split_join_condition(
+            rename(expr, qualified), [left, right]
+        )
+
+    # Хеш-таблица строится по меньшей стороне. Готовый индекс строить
+    # не нужно: индекс по столбцу большей таблицы служит стороной
+    # построения, а сканируется меньшая - так и обращений к нему меньше
+    indexed = {
+        table_name: column == ID or column in tables[table_name].index_kinds
+        for table_name, column in join_on.items()
+    }
+    smaller, larger = left, right
+    if tables[right].row_count < tables[left].row_count:
+        smaller, larger = right, left
+    build, probe = smaller, larger
+    if indexed[larger]:
+        build, probe = larger, smaller
+
+    find = _join_build(
+        tables[build], join_on[build], filters[build], indexed[build]
+    )
+    needed = list(dict.fromkeys(
+        output + sorted(condition_columns(residual) if residual else ())
+    ))
+    probe_getters = _join_getters(tables[probe], needed)
+    build_getters = _join_getters(tables[build], needed)
+    probe_key = tables[probe].store.columns[join_on[probe]].getter()
+    accept = residual.predicate if residual is not None else None
+
+    probe_table, probe_filter = tables[probe], filters[probe]
+    if probe_filter is None:
+        positions = probe_table.positions()
+    elif limit is None:
+        positions = iter(matching_positions(probe_table, probe_filter))
+    else:
+        positions = iter_positions(probe_table, probe_filter)
+
+    def joined() -> Iterator[Dict]:
+        for position in positions:
+            matches = find(probe_key(position))
+            if not matches:
+                continue
+            base = {name: get(position) for name, get in probe_getters}
+            for match in matches:
+                record = dict(base)
+                for name, get in build_getters:
+                    record[name] = get(match)
+                if accept is not None and not accept(record):
+                    continue
+                if len(needed) != len(output):
+                    record = {name: record[name] for name in output}
+                yield record
+
+    stop = None if limit is None else offset + limit
+    return output, islice(joined(), offset, stop)
 
 
 @handle_db_errors
 @confirm_action("обновить записи")
 @log_time
 def update_records(
-    metadata: Dict[str, Any], table_name: str, 
+    metadata: Dict[str, Table], table_name: str, 
     set_clause: str, where_clause: str = None
-) -> Dict[str, Any]:
+) -> Dict[str, Table]:
     """Обновляет записи в таблице."""
 
     if table_name not in metadata:
         raise ValueError(ERROR_TABLE_NOT_EXISTS.format(table_name))
     
-    table_info = metadata[table_name]
-    records = table_info.get('data', [])
+    table = metadata[table_name]
     
-    if not records:
+    if not table.row_count:
         print(f"Таблица '{table_name}' пуста, нечего обновлять")
         return metadata
     
@@ -306,95 +865,22 @@ def update_records(
         col_name = col_name.strip()
         new_value_str = new_value_str.strip()
         
-        column_types = {name: type for name, type in table_info['columns']}
+        column_types = table.column_types()
         if col_name not in column_types:
             raise ValueError(
                 ERROR_COLUMN_NOT_EXISTS.format(col_name, table_name)
             )
         
-        col_type = column_types[col_name]
+        if col_name == ID:
+            raise ValueError(ERROR_ID_READONLY)
         
-        try:
-            if col_type == 'int':
-                set_updates[col_name] = int(new_value_str)
-            elif col_type == 'bool':
-                value_lower = new_value_str.lower()
-                set_updates[col_name] = value_lower in TRUE_VALUES
-            elif col_type == 'str':
-                if (new_value_str.startswith('"') 
-                    and new_value_str.endswith('"')) \
-                   or (new_value_str.startswith("'") 
-                       and new_value_str.endswith("'")):
-                    set_updates[col_name] = new_value_str[1:-1]
-                else:
-                    set_updates[col_name] = new_value_str
-            else:
-                raise ValueError(ERROR_INVALID_TYPE.format(col_type))
-        except ValueError:
-            raise ValueError(
-                f'Неверное значение для столбца "{col_name}" '
-                f'(тип {col_type}): "{new_value_str}"'
-            )
-    
-    def record_matches(record: Dict, condition: str) -> bool:
-        if not condition:
-            return True
-        
-        match = re.match(r'(\w+)([<>=!]+)(.+)', condition)
-        if not match:
-            raise ValueError(f'Некорректное условие WHERE: "{condition}"')
-        
-        col_name, operator, value_str = match.groups()
-        
-        if col_name not in record:
-            return False
-        
-        col_type = column_types.get(col_name)
-        if not col_type:
-            return False
-        
-        try:
-            if col_type == 'int':
-                value = int(value_str)
-            elif col_type == 'bool':
-                value_lower = value_str.lower()
-                value = value_lower in TRUE_VALUES
-            elif col_type == 'str':
-                if (value_str.startswith('"') and value_str.endswith('"')) \
-                   or (value_str.startswith("'") and value_str.endswith("'")):
-                    value = value_str[1:-1]
-                else:
-                    value = value_str
-            else:
-                return False
-        except ValueError:
-            return False
-        
-        record_value = record[col_name]
-        if operator == '>':
-            return record_value > value
-        elif operator == '<':
-            return record_value < value
-        elif operator == '>=':
-            return record_value >= value
-        elif operator == '<=':
-            return record_value <= value
-        elif operator == '==':
-            return record_value == value
-        elif operator == '!=':
-            return record_value != value
-        
-        return False
-    
-    updated_count = 0
-    for record in records:
-        if record_matches(record, where_clause):
-            for col_name, new_value in set_updates.items():
-                record[col_name] = new_value
-            updated_count += 1
+        set_updates[col_name] = _parse_value(
+            col_name, column_types[col_name], new_value_str
+        )
     
-    table_info['data'] = records
-    metadata[table_name] = table_info
+    updated_count = table.update(
+        _matching_positions(table, where_clause), set_updates
+    )
     
     if updated_count > 0:
         print(f"Обновлено {updated_count} записей в таблице '{table_name}'")
@@ -408,97 +894,77 @@ def update_records(
 @confirm_action("удалить записи")
 @log_time
 def delete_records(
-    metadata: Dict[str, Any], table_name: str, 
+    metadata: Dict[str, Table], table_name: str, 
     where_clause: str = None
-) -> Dict[str, Any]:
+) -> Dict[str, Table]:
     """Удаляет записи из таблицы."""
 
     if table_name not in metadata:
         raise ValueError(ERROR_TABLE_NOT_EXISTS.format(table_name))
     
-    table_info = metadata[table_name]
-    records = table_info.get('data', [])
+    table = metadata[table_name]
     
-    if not records:
+    if not table.row_count:
         print(f"Таблица '{table_name}' уже пуста")
         return metadata
     
     if not where_clause:
-        table_info['data'] = []
-        metadata[table_name] = table_info
+        table.clear()
         print(f"Удалены все записи из таблицы '{table_name}'")
         return metadata
     
-    match = re.match(r'(\w+)([<>=!]+)(.+)', where_clause)
-    if not match:
-        raise ValueError(
-            f'Некорректное условие: "{where_clause}". '
-            f'Используйте "столбец оператор значение"'
-        )
+    deleted_count = table.delete(_matching_positions(table, where_clause))
     
-    col_name, operator, value_str = match.groups()
+    if deleted_count > 0:
+        print(f"Удалено {deleted_count} записей из таблицы '{table_name}'")
+    else:
+        print(f"Не найдено записей для удаления в таблице '{table_name}'")
     
-    column_types = {name: type for name, type in table_info['columns']}
-    if col_name not in column_types:
-        raise ValueError(
-            ERROR_COLUMN_NOT_EXISTS.format(col_name, table_name)
-        )
+    return metadata
+
+
+@handle_db_errors
+@log_time
+def create_index(
+    metadata: Dict[str, Table], table_name: str, column: str,
+    kind: str = "hash"
+) -> Dict[str, Table]:
+    """Создает индекс по столбцу таблицы."""
+
+    if table_name not in metadata:
+        raise ValueError(ERROR_TABLE_NOT_EXISTS.format(table_name))
     
-    col_type = column_types[col_name]
+    table = metadata[table_name]
+    if column not in table.column_types():
+        raise ValueError(ERROR_COLUMN_NOT_EXISTS.format(column, table_name))
     
-    try:
-        if col_type == 'int':
-            value = int(value_str)
-        elif col_type == 'bool':
-            value_lower = value_str.lower()
-            value = value_lower in TRUE_VALUES
-        elif col_type == 'str':
-            if (value_str.startswith('"') and value_str.endswith('"')) \
-               or (value_str.startswith("'") and value_str.endswith("'")):
-                value = value_str[1:-1]
-            else:
-                value = value_str
-        else:
-            raise ValueError(ERROR_INVALID_TYPE.format(col_type))
-    except ValueError:
-        raise ValueError(
-            f'Неверное значение для столбца "{col_name}" '
-            f'(тип {col_type}): "{value_str}"'
-        )
+    if kind not in INDEX_KINDS:
+        raise ValueError(ERROR_INVALID_INDEX.format(kind))
     
-    def record_matches(record: Dict) -> bool:
-        if col_name not in record:
-            return False
-        
-        record_value = record[col_name]
-        
-        if operator == '>':
-            return record_value > value
-        elif operator == '<':
-            return record_value < value
-        elif operator == '>=':
-            return record_value >= value
-        elif operator == '<=':
-            return record_value <= value
-        elif operator == '==':
-            return record_value == value
-        elif operator == '!=':
-            return record_value != value
-        
-        return False
+    if column in table.index_kinds:
+        raise ValueError(ERROR_INDEX_EXISTS.format(column, table_name))
     
-    initial_count = len(records)
-    filtered_records = [
-        record for record in records if not record_matches(record)
-    ]
-    deleted_count = initial_count - len(filtered_records)
+    table.create_index(column, kind)
+    print(f'Индекс {kind} по столбцу "{column}" таблицы "{table_name}" создан')
     
-    table_info['data'] = filtered_records
-    metadata[table_name] = table_info
+    return metadata
+
+
+@handle_db_errors
+@log_time
+def drop_index(
+    metadata: Dict[str, Table], table_name: str, column: str
+) -> Dict[str, Table]:
+    """Удаляет индекс по столбцу таблицы."""
+
+    if table_name not in metadata:
+        raise ValueError(ERROR_TABLE_NOT_EXISTS.format(table_name))
     
-    if deleted_count > 0:
-        print(f"Удалено {deleted_count} записей из таблицы '{table_name}'")
-    else:
-        print(f"Не найдено записей для удаления в таблице '{table_name}'")
+    table = metadata[table_name]
+    if column not in table.index_kinds:
+        raise ValueError(ERROR_INDEX_NOT_EXISTS.format(column, table_name))
+    
+    table.drop_index(column)
+    print(f'Индекс по столбцу "{column}" таблицы "{table_name}" удалён')
     
     return metadata
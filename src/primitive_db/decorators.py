@@ -3,9 +3,15 @@
 Декораторы для базы данных.
 """
 import json
+import threading
 import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from functools import wraps
-from typing import Any, Callable
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# Потоки, в которых confirm_action не спрашивает пользователя
+_unattended = threading.local()
 
 
 def handle_db_errors(func: Callable) -> Callable:
@@ -25,6 +31,20 @@ def handle_db_errors(func: Callable) -> Callable:
     return wrapper
 
 
+@contextmanager
+def unattended() -> Iterator[None]:
+    """
+    Внутри блока подтверждения в текущем потоке считаются полученными
+    (сервер, скрипты - спросить некого).
+    """
+    previous = getattr(_unattended, 'active', False)
+    _unattended.active = True
+    try:
+        yield
+    finally:
+        _unattended.active = previous
+
+
 def confirm_action(action_description: str) -> Callable:
     """
     Декоратор для подтверждения действий.
@@ -32,6 +52,9 @@ def confirm_action(action_description: str) -> Callable:
     def decorator(func: Callable) -> Callable:
         @wraps(func)
         def wrapper(*args, **kwargs) -> Any:
+            if getattr(_unattended, 'active', False):
+                return func(*args, **kwargs)
+            
             import prompt
             answer = prompt.string(
                 f"Вы уверены, что хотите {action_description}? (yes/no): "
@@ -68,51 +91,130 @@ def log_time(func: Callable) -> Callable:
     return wrapper
 
 
-def cache_results(max_size: int = 100) -> Callable:
+def cache_results(
+    max_size: int = 100,
+    key: Optional[Callable[..., Any]] = None,
+    max_items: Optional[int] = None,
+    stream: bool = False,
+) -> Callable:
     """
-    Декоратор для кэширования результатов функций.
+    Декоратор для кэширования результатов функций (LRU).
+
+    key вычисляет ключ кэша из аргументов; если он вернул None,
+    вызов идёт мимо кэша. max_items ограничивает суммарную длину
+    закэшированных результатов: более длинный не кэшируется, а старые
+    вытесняются, пока сумма не уложится в предел.
+
+    stream=True - функция возвращает итератор: вызывающий получает его
+    элементы сразу, а в кэш попадает их список, если итератор дочитан
+    до конца.
     """
     def decorator(func: Callable) -> Callable:
-        cache = {}
-        cache_keys = []
+        cache = OrderedDict()
+        counters = {'hits': 0, 'misses': 0, 'items': 0}
+        # Кэш могут читать несколько потоков (сервер)
+        lock = threading.Lock()
+        
+        def _size(result: Any) -> int:
+            return len(result) if max_items is not None else 0
+        
+        def store(cache_key: Any, result: Any) -> None:
+            size = _size(result)
+            if max_items is not None and size > max_items:
+                return
+            with lock:
+                if cache_key in cache:
+                    counters['items'] -= _size(cache.pop(cache_key))
+                cache[cache_key] = result
+                counters['items'] += size
+                
+                # Ограничение для размера кэша: выбрасываем самые старые
+                while len(cache) > max_size or (
+                    max_items is not None and counters['items'] > max_items
+                ):
+                    _, evicted = cache.popitem(last=False)
+                    counters['items'] -= _size(evicted)
+        
+        def collect(cache_key: Any, iterator: Iterator[Any]) -> Iterator[Any]:
+            items: Optional[List[Any]] = []
+            for item in iterator:
+                if items is not None:
+                    items.append(item)
+                    if max_items is not None and len(items) > max_items:
+                        items = None
+                yield item
+            if items is not None:
+                store(cache_key, items)
         
         @wraps(func)
         def wrapper(*args, **kwargs) -> Any:
-            # Создаем сериализуемый ключ кэша
-            try:
-                cache_key = json.dumps((args, kwargs), sort_keys=True, default=str)
-            except:
-                cache_key = str((args, kwargs))
+            if key is not None:
+                cache_key = key(*args, **kwargs)
+            else:
+                # Создаем сериализуемый ключ кэша
+                try:
+                    cache_key = json.dumps(
+                        (args, kwargs), sort_keys=True, default=str
+                    )
+                except (TypeError, ValueError):
+                    cache_key = str((args, kwargs))
+            
+            if cache_key is None:
+                return func(*args, **kwargs)
             
-            if cache_key in cache:
+            with lock:
+                cached = cache_key in cache
+                if cached:
+                    cache.move_to_end(cache_key)
+                    counters['hits'] += 1
+                    result = cache[cache_key]
+                else:
+                    counters['misses'] += 1
+            if cached:
                 print(f"Результат взят из кэша (функция: {func.__name__})")
-                return cache[cache_key]
+                return iter(result) if stream else result
             
             result = func(*args, **kwargs)
-            
-            # Добавляем в кэш
-            cache[cache_key] = result
-            cache_keys.append(cache_key)
-            
-            # Ограничение для размера кэша
-            if len(cache_keys) > max_size:
-                oldest_key = cache_keys.pop(0)
-                del cache[oldest_key]
-            
+            if stream:
+                return collect(cache_key, result)
+            store(cache_key, result)
             return result
         
         # Управление кэшом
         def clear_cache():
             """Очистить кэш."""
-            cache.clear()
-            cache_keys.clear()
+            with lock:
+                cache.clear()
+                counters['items'] = 0
         
         def get_cache_size():
             """Текущий размер кэша."""
             return len(cache)
         
+        def invalidate(prefix: Any) -> None:
+            """Удалить записи, ключ которых начинается с prefix."""
+            with lock:
+                stale = [
+                    cache_key for cache_key in cache
+                    if isinstance(cache_key, tuple) and cache_key[0] == prefix
+                ]
+                for cache_key in stale:
+                    counters['items'] -= _size(cache.pop(cache_key))
+        
+        def cache_info() -> Dict[str, int]:
+            """Счётчики попаданий, промахов и размер кэша."""
+            return {
+                'hits': counters['hits'],
+                'misses': counters['misses'],
+                'size': len(cache),
+                'max_size': max_size,
+                'items': counters['items'],
+            }
+        
         wrapper.clear_cache = clear_cache
         wrapper.get_cache_size = get_cache_size
+        wrapper.invalidate = invalidate
+        wrapper.cache_info = cache_info
         
         return wrapper
     return decorator
@@ -1,44 +1,253 @@
 #!/usr/bin/env python3
 
+from typing import Callable, Dict, List, Optional
+
 import prompt
 
-from src.primitive_db.constants import DATA_DIR, METADATA_FILE
+from src.primitive_db.constants import DATA_DIR, FLUSH_MAX_DELAY, METADATA_FILE
 from src.primitive_db.core import (
+    aggregate_label,
+    aggregate_records,
+    copy_from,
+    copy_to,
+    create_index,
     create_table,
     delete_records,
+    drop_index,
     drop_table,
     insert_record,
+    iter_records,
+    join_records,
     list_tables,
-    select_records,
     update_records,
 )
 from src.primitive_db.parser import (
+    is_aggregate_select,
+    is_join_select,
+    is_write_command,
+    parse_aggregate,
     parse_command,
+    parse_copy,
+    parse_create_index,
     parse_create_table,
     parse_delete,
+    parse_drop_index,
     parse_drop_table,
     parse_insert,
+    parse_join,
     parse_select,
     parse_update,
+    read_tables,
 )
+from src.primitive_db.session import Database, close_snapshot
+from src.primitive_db.table import Table
 from src.primitive_db.utils import (
-    load_metadata,
     pretty_print_table,
     print_help,
-    save_metadata,
-    save_table_data,
+    print_paged,
 )
 
 
+def ask_more() -> bool:
+    """Спрашивает, показывать ли следующую страницу."""
+    answer = prompt.string("-- Enter - дальше, q - хватит: ")
+    return answer.strip().lower() not in ("q", "n", "no", "нет", "й")
+
+
+def execute(
+    db: Database,
+    metadata: Dict[str, Table],
+    command: str,
+    args: List[str],
+    more: Optional[Callable[[], bool]] = None,
+) -> None:
+    """Выполняет одну команду (кроме exit) под уже взятой блокировкой.
+
+    more передаётся в print_paged для постраничного вывода select.
+    """
+    if command == "help":
+        print_help()
+
+    elif command == "create_table":
+        try:
+            table_name, columns = parse_create_table(args)
+            metadata = create_table(metadata, table_name, columns)
+            db.mark_dirty(table_name)
+            db.flush()
+        except ValueError as e:
+            print(f"{e}")
+
+    elif command == "drop_table":
+        try:
+            table_name = parse_drop_table(args)
+            metadata = drop_table(metadata, table_name)
+            db.mark_dirty(table_name)
+            db.flush()
+        except ValueError as e:
+            print(f"{e}")
+
+    elif command == "insert":
+        try:
+            table_name, values = parse_insert(args)
+            metadata = insert_record(metadata, table_name, values)
+            db.mark_dirty(table_name)
+            db.flush()
+
+        except ValueError as e:
+            print(f"{e}")
+
+    elif command == "copy":
+        try:
+            table_name, direction, filepath, file_format, condition = (
+                parse_copy(args)
+            )
+            if direction == "to":
+                copy_to(
+                    metadata, table_name, filepath,
+                    file_format, condition
+                )
+                return
+
+            def persist() -> None:
+                db.mark_dirty(table_name)
+                db.flush()
+
+            metadata = copy_from(
+                metadata, table_name, filepath, persist
+            )
+
+        except ValueError as e:
+            print(f"{e}")
+
+    elif command == "list_tables":
+        list_tables(metadata)
+
+    elif command == "select" and is_join_select(args):
+        try:
+            left, right, left_column, right_column, *query = parse_join(args)
+            columns, records = join_records(
+                metadata, left, right, left_column, right_column, *query
+            )
+            print_paged(records, f"{left} join {right}", columns, more=more)
+
+        except ValueError as e:
+            print(f"{e}")
+
+    elif command == "select" and is_aggregate_select(args):
+        try:
+            table_name, aggregates, group_by, condition = (
+                parse_aggregate(args)
+            )
+            records = aggregate_records(
+                metadata, table_name, aggregates, group_by, condition
+            )
+            columns = group_by + [
+                aggregate_label(func, column)
+                for func, column in aggregates
+            ]
+            pretty_print_table(records, table_name, columns)
+
+        except ValueError as e:
+            print(f"{e}")
+
+    elif command == "select":
+        try:
+            table_name, columns, condition, limit, offset = (
+                parse_select(args)
+            )
+            records = iter_records(
+                metadata, table_name, condition, columns, limit, offset
+            )
+            columns = columns or [
+                name for name, _ in metadata[table_name].columns
+            ]
+            print_paged(records, table_name, columns, more=more)
+
+        except ValueError as e:
+            print(f"{e}")
+
+    elif command == "update":
+        try:
+            table_name, set_clause, where_clause = parse_update(args)
+            metadata = update_records(
+                metadata, table_name, set_clause, where_clause
+            )
+            db.mark_dirty(table_name)
+            db.flush()
+
+        except ValueError as e:
+            print(f"{e}")
+
+    elif command == "delete":
+        try:
+            table_name, where_clause = parse_delete(args)
+            metadata = delete_records(
+                metadata, table_name, where_clause
+            )
+            db.mark_dirty(table_name)
+            db.flush()
+
+        except ValueError as e:
+            print(f"{e}")
+
+    elif command == "create_index":
+        try:
+            table_name, column, kind = parse_create_index(args)
+            metadata = create_index(metadata, table_name, column, kind)
+            db.mark_dirty(table_name)
+            db.flush()
+
+        except ValueError as e:
+            print(f"{e}")
+
+    elif command == "drop_index":
+        try:
+            table_name, column = parse_drop_index(args)
+            metadata = drop_index(metadata, table_name, column)
+            db.mark_dirty(table_name)
+            db.flush()
+
+        except ValueError as e:
+            print(f"{e}")
+
+    elif command == "begin":
+        try:
+            db.begin()
+            print("Транзакция начата.")
+        except ValueError as e:
+            print(f"{e}")
+
+    elif command == "commit":
+        try:
+            in_transaction = db.transaction is not None
+            db.commit()
+            if in_transaction:
+                print("Транзакция зафиксирована.")
+            else:
+                print("Изменения сохранены.")
+        except ValueError as e:
+            print(f"{e}")
+
+    elif command == "rollback":
+        try:
+            db.rollback()
+            print("Транзакция отменена.")
+        except ValueError as e:
+            print(f"{e}")
+
+    else:
+        print(f"Функции '{command}' нет. Попробуйте снова.")
+
+
 def run() -> None:
     """Основной цикл работы базы данных"""
     print("База данных запущена!")
     print_help()
     
+    db = Database(METADATA_FILE, DATA_DIR, FLUSH_MAX_DELAY)
+    
     while True:
         try:
-            metadata = load_metadata(METADATA_FILE)
-            
             user_input = prompt.string(">>>Введите команду: ").strip()
             if not user_input:
                 continue
@@ -50,87 +259,40 @@ def run() -> None:
                 continue
             
             if command == "exit":
-                print("Выход из программы. Данные сохранены.")
-                break
-                
-            elif command == "help":
-                print_help()
-                
-            elif command == "create_table":
-                try:
-                    table_name, columns = parse_create_table(args)
-                    metadata = create_table(metadata, table_name, columns)
-                    save_metadata(METADATA_FILE, metadata)
-                except ValueError as e:
-                    print(f"{e}")
-                    
-            elif command == "drop_table":
-                try:
-                    table_name = parse_drop_table(args)
-                    metadata = drop_table(metadata, table_name)
-                    save_metadata(METADATA_FILE, metadata)
-                except ValueError as e:
-                    print(f"{e}")
-                    
-            elif command == "insert":
-                try:
-                    table_name, values = parse_insert(args)
-                    metadata = insert_record(metadata, table_name, values)
-                    save_metadata(METADATA_FILE, metadata)
-                    
-                    table_data = metadata[table_name].get('data', [])
-                    save_table_data(table_name, table_data, DATA_DIR)
-                    
-                except ValueError as e:
-                    print(f"{e}")
-                    
-            elif command == "list_tables":
-                list_tables(metadata)
-                
-            elif command == "select":
-                try:
-                    table_name, condition = parse_select(args)
-                    records = select_records(
-                        metadata, table_name, condition
-                    )
-                    pretty_print_table(records, table_name)
-                    
-                except ValueError as e:
-                    print(f"{e}")
-                
-            elif command == "update":
                 try:
-                    table_name, set_clause, where_clause = parse_update(args)
-                    metadata = update_records(
-                        metadata, table_name, set_clause, where_clause
-                    )
-                    save_metadata(METADATA_FILE, metadata)
-                    
-                    table_data = metadata[table_name].get('data', [])
-                    save_table_data(table_name, table_data, DATA_DIR)
-                    
+                    db.close()
                 except ValueError as e:
+                    # Изменения остались в памяти: выход можно повторить
                     print(f"{e}")
-                
-            elif command == "delete":
-                try:
-                    table_name, where_clause = parse_delete(args)
-                    metadata = delete_records(
-                        metadata, table_name, where_clause
-                    )
-                    save_metadata(METADATA_FILE, metadata)
-                    
-                    table_data = metadata[table_name].get('data', [])
-                    save_table_data(table_name, table_data, DATA_DIR)
-                    
-                except ValueError as e:
-                    print(f"{e}")
-                
-            else:
-                print(f"Функции '{command}' нет. Попробуйте снова.")
+                    continue
+                print("Выход из программы. Данные сохранены.")
+                break
+            
+            if is_write_command(command, args):
+                metadata = db.acquire(exclusive=True)
+                execute(db, metadata, command, args)
+                continue
+            
+            # Под блокировкой берутся только снимки, читаются они без
+            # неё: пока пользователь листает страницы, писатели не ждут
+            db.acquire(exclusive=False)
+            try:
+                metadata = db.snapshot(read_tables(command, args))
+            finally:
+                db.release()
+            try:
+                execute(db, metadata, command, args, ask_more)
+            finally:
+                close_snapshot(metadata)
                 
         except KeyboardInterrupt:
             print("\n Прервано пользователем. Выход.")
+            try:
+                db.close()
+            except ValueError as e:
+                print(f"{e}")
             break
         except Exception as e:
             print(f" Неожиданная ошибка: {e}")
+        finally:
+            db.release()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Вторичные индексы: значение столбца -> позиции строк в таблице.
+
+Операции доступа: ==, !=, <, <=, >, >=, in (множество значений),
+between (пара границ, включительно) и prefix (префикс строки).
+"""
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, Iterable, List, Sequence, Set, Tuple
+
+# Больше любого символа: верхняя граница диапазона для префикса
+PREFIX_END = "\U0010ffff"
+
+
+class HashIndex:
+    """Хеш-индекс для ==, != и in."""
+
+    kind = "hash"
+    operators = {"==", "!=", "in"}
+
+    def __init__(self, column: str) -> None:
+        self.column = column
+        self.entries: Dict[Any, Set[int]] = {}
+        self.size = 0
+
+    def build(self, values: Sequence[Any], alive: Sequence[int]) -> None:
+        """Строит индекс по значениям столбца живых позиций."""
+        self.entries = {}
+        self.size = 0
+        for position, value in enumerate(values):
+            if alive[position]:
+                self.add(value, position)
+
+    def add(self, value: Any, position: int) -> None:
+        self.entries.setdefault(value, set()).add(position)
+        self.size += 1
+
+    def add_many(self, values: List[Any], positions: Iterable[int]) -> None:
+        for value, position in zip(values, positions):
+            self.add(value, position)
+
+    def remove(self, value: Any, position: int) -> None:
+        positions = self.entries.get(value)
+        if positions is None or position not in positions:
+            return
+        positions.discard(position)
+        self.size -= 1
+        if not positions:
+            del self.entries[value]
+
+    def estimate(self, operator: str, value: Any) -> int:
+        """Сколько позиций вернёт lookup, без их сбора."""
+        if operator == "==":
+            return len(self.entries.get(value, ()))
+        if operator == "in":
+            return sum(len(self.entries.get(item, ())) for item in value)
+        return self.size - len(self.entries.get(value, ()))
+
+    def lookup(self, operator: str, value: Any) -> Iterable[int]:
+        """Позиции строк, удовлетворяющих условию."""
+        if operator == "==":
+            return self.entries.get(value, set())
+        if operator == "in":
+            return [
+                position
+                for item in value
+                for position in self.entries.get(item, ())
+            ]
+        return [
+            position
+            for key, positions in self.entries.items() if key != value
+            for position in positions
+        ]
+
+
+class SortedIndex:
+    """Упорядоченный индекс (bisect) для сравнений, in, between и prefix."""
+
+    kind = "sorted"
+    operators = {"==", "<", "<=", ">", ">=", "in", "between", "prefix"}
+
+    def __init__(self, column: str) -> None:
+        self.column = column
+        self.keys: List[Any] = []
+        self.positions: List[int] = []
+
+    def build(self, values: Sequence[Any], alive: Sequence[int]) -> None:
+        """Строит индекс по значениям столбца живых позиций."""
+        pairs = sorted(
+            (value, position)
+            for position, value in enumerate(values) if alive[position]
+        )
+        self.keys = [key for key, _ in pairs]
+        self.positions = [position for _, position in pairs]
+
+    def add(self, value: Any, position: int) -> None:
+        at = bisect_right(self.keys, value)
+        self.keys.insert(at, value)
+        self.positions.insert(at, position)
+
+    def add_many(self, values: List[Any], positions: Iterable[int]) -> None:
+        """Слияние пакета с индексом: O(n + m log n) вместо m вставок."""
+        keys, old_positions = self.keys, self.positions
+        new_keys: List[Any] = []
+        new_positions: List[int] = []
+        start = 0
+        for value, position in sorted(zip(values, positions)):
+            at = bisect_right(keys, value, start)
+            new_keys += keys[start:at]
+            new_positions += old_positions[start:at]
+            new_keys.append(value)
+            new_positions.append(position)
+            start = at
+        new_keys += keys[start:]
+        new_positions += old_positions[start:]
+        self.keys, self.positions = new_keys, new_positions
+
+    def remove(self, value: Any, position: int) -> None:
+        start = bisect_left(self.keys, value)
+        end = bisect_right(self.keys, value)
+        for at in range(start, end):
+            if self.positions[at] == position:
+                del self.keys[at]
+                del self.positions[at]
+                return
+
+    def _ranges(self, operator: str, value: Any) -> List[Tuple[int, int]]:
+        """Диапазоны [start, end) в отсортированных ключах."""
+        keys = self.keys
+        if operator == "==":
+            return [(bisect_left(keys, value), bisect_right(keys, value))]
+        if operator == "<":
+            return [(0, bisect_left(keys, value))]
+        if operator == "<=":
+            return [(0, bisect_right(keys, value))]
+        if operator == ">":
+            return [(bisect_right(keys, value), len(keys))]
+        if operator == ">=":
+            return [(bisect_left(keys, value), len(keys))]
+        if operator == "in":
+            return [
+                (bisect_left(keys, item), bisect_right(keys, item))
+                for item in sorted(value)
+            ]
+        if operator == "between":
+            low, high = value
+            return [(bisect_left(keys, low), bisect_right(keys, high))]
+        return [
+            (bisect_left(keys, value), bisect_left(keys, value + PREFIX_END))
+        ]
+
+    def estimate(self, operator: str, value: Any) -> int:
+        """Сколько позиций вернёт lookup, без их сбора."""
+        return sum(
+            max(end - start, 0) for start, end in self._ranges(operator, value)
+        )
+
+    def lookup(self, operator: str, value: Any) -> Iterable[int]:
+        """Позиции строк, удовлетворяющих условию."""
+        return [
+            position
+            for start, end in self._ranges(operator, value)
+            for position in self.positions[start:end]
+        ]
+
+
+INDEX_TYPES = {index.kind: index for index in (HashIndex, SortedIndex)}
+
+
+def make_index(column: str, kind: str) -> HashIndex | SortedIndex:
+    """Создает пустой индекс нужного вида."""
+    return INDEX_TYPES[kind](column)
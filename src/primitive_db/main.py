@@ -1,11 +1,51 @@
 #!/usr/bin/env python3
+import argparse
+import sys
+
+from src.primitive_db import parallel
+from src.primitive_db.constants import SERVER_HOST, SERVER_PORT
 from src.primitive_db.engine import run
+from src.primitive_db.script import run_file, run_script
+from src.primitive_db.server import serve
 
 
 def main() -> None:
     """функция запуска базы данных"""
 
-    run()
+    parser = argparse.ArgumentParser(
+        prog="project", description="Примитивная база данных"
+    )
+    parser.add_argument(
+        "-c", dest="commands", metavar="КОМАНДЫ",
+        help='выполнить команды через ";" и выйти',
+    )
+    parser.add_argument(
+        "-j", "--partitions", type=int, metavar="N",
+        help="разделов параллельного скана (0 - по числу ядер, 1 - без "
+        "пула процессов)",
+    )
+    modes = parser.add_subparsers(dest="mode")
+    exec_parser = modes.add_parser(
+        "exec", help="выполнить скрипт: одна загрузка, одно сохранение"
+    )
+    exec_parser.add_argument("script")
+    serve_parser = modes.add_parser(
+        "serve", help="сетевой режим: база в памяти, команды по TCP"
+    )
+    serve_parser.add_argument("--host", default=SERVER_HOST)
+    serve_parser.add_argument("--port", type=int, default=SERVER_PORT)
+    options = parser.parse_args()
+    if options.partitions is not None:
+        parallel.configure(partitions=options.partitions)
+
+    if options.commands is not None:
+        sys.exit(run_script(options.commands))
+    if options.mode == "exec":
+        sys.exit(run_file(options.script))
+    if options.mode == "serve":
+        serve(options.host, options.port)
+    else:
+        run()
 
 if __name__ == "__main__":
 
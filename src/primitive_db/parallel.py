@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Параллельный скан: условие WHERE по диапазонам строк в пуле процессов.
+
+Столбцы, которые читает условие, и карта живых строк копируются в
+блоки multiprocessing.shared_memory. Блоки живут, пока таблица не
+изменится: следующие запросы к той же версии таблицы копируют только
+недостающие столбцы. Процессы пула получают текст условия, схему и
+имена блоков, сами компилируют условие, проверяют свой диапазон
+позиций и возвращают подходящие позиции; они склеиваются по порядку
+диапазонов. Таблицы меньше PARALLEL_MIN_ROWS и конфигурация с одним
+разделом сканируются в текущем процессе, как и любая таблица, если пул
+или общая память недоступны.
+
+Пул запускается методом spawn, и процессы стартуют долго: warm_up()
+запускает их в фоне при открытии базы с большой таблицей.
+"""
+import atexit
+import multiprocessing
+import os
+import pickle
+import threading
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.primitive_db.columnar import (
+    BoolColumn,
+    ColumnStore,
+    IntColumn,
+    StrColumn,
+)
+from src.primitive_db.conditions import Expr, columns, compile_condition
+from src.primitive_db.constants import PARALLEL_MIN_ROWS, SCAN_PARTITIONS
+
+# Столбец в общей памяти: тип, блок значений (для str - кодов) и блок
+# словаря (pickle, только для str)
+ColumnBlocks = Tuple[str, str, Optional[str]]
+
+_settings = {'partitions': SCAN_PARTITIONS, 'min_rows': PARALLEL_MIN_ROWS}
+_pool: Optional[ProcessPoolExecutor] = None
+# Сервер сканирует из нескольких потоков: пул создаётся один
+_pool_lock = threading.Lock()
+
+
+class _Export:
+    """Блоки общей памяти одной версии таблицы.
+
+    Блоки освобождаются, когда версия устарела и её больше не
+    сканирует ни один поток.
+    """
+
+    def __init__(self, version: int, rows: int) -> None:
+        self.version = version
+        self.rows = rows
+        self.blocks: List[SharedMemory] = []
+        self.columns: Dict[str, ColumnBlocks] = {}
+        self.alive: Optional[str] = None
+        self.users = 0
+        self.retired = False
+
+    def release(self) -> None:
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+
+# Таблица -> блоки её последней просканированной версии
+_exports: Dict[str, _Export] = {}
+_exports_lock = threading.Lock()
+
+
+def configure(
+    partitions: Optional[int] = None, min_rows: Optional[int] = None
+) -> None:
+    """Число разделов (0 - по числу ядер) и порог параллельного скана."""
+    if partitions is not None:
+        _settings['partitions'] = partitions
+        _drop_pool()
+    if min_rows is not None:
+        _settings['min_rows'] = min_rows
+
+
+def partitions() -> int:
+    """Сколько разделов получает скан."""
+    return _settings['partitions'] or os.cpu_count() or 1
+
+
+def warm_up(rows: int) -> None:
+    """Запускает процессы пула в фоне, если таблица в rows строк их займёт."""
+    if _pool is not None or partitions() < 2 or rows < _settings['min_rows']:
+        return
+    try:
+        pool = _executor()
+        for _ in range(partitions()):
+            pool.submit(_ready)
+    except (OSError, BrokenProcessPool):
+        _drop_pool()
+
+
+def _ready() -> None:
+    """Пустая задача: процесс пула запущен и импортировал модуль."""
+
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: форк процесса с потоками (сервер) мог бы унести в
+            # дочерний процесс чужие захваченные блокировки
+            _pool = ProcessPoolExecutor(
+                max_workers=partitions(),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+@atexit.register
+def _drop_pool() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(cancel_futures=True)
+
+
+def _retire(export: _Export) -> None:
+    """Версия устарела: блоки освобождаются после последнего скана."""
+    export.retired = True
+    if not export.users:
+        export.release()
+
+
+def forget(table_name: str) -> None:
+    """Освобождает блоки удалённой таблицы."""
+    with _exports_lock:
+        export = _exports.pop(table_name, None)
+        if export is not None:
+            _retire(export)
+
+
+@atexit.register
+def _drop_exports() -> None:
+    with _exports_lock:
+        exports = list(_exports.values())
+        _exports.clear()
+        for export in exports:
+            _retire(export)
+
+
+def _share(data: Any, blocks: List[SharedMemory]) -> str:
+    """Копирует буфер в новый блок общей памяти и возвращает его имя."""
+    with memoryview(data) as view, view.cast('B') as raw:
+        block = SharedMemory(create=True, size=max(raw.nbytes, 1))
+        blocks.append(block)
+        block.buf[:raw.nbytes] = raw
+    return block.name
+
+
+def _export(
+    store: ColumnStore, names: List[str], blocks: List[SharedMemory]
+) -> Dict[str, ColumnBlocks]:
+    """Кладёт столбцы names (первые len(store) позиций) в общую память."""
+    rows = len(store)
+    layout = {}
+    for name in names:
+        column = store.columns[name]
+        if isinstance(column, StrColumn):
+            codes = _share(column.codes[:rows], blocks)
+            dictionary = _share(
+                pickle.dumps(list(column.dictionary)), blocks
+            )
+            layout[name] = ('str', codes, dictionary)
+        elif isinstance(column, BoolColumn):
+            layout[name] = ('bool', _share(column.data[:rows], blocks), None)
+        else:
+            layout[name] = ('int', _share(column.data[:rows], blocks), None)
+    return layout
+
+
+def _acquire(
+    store: ColumnStore, table_name: str, version: int, names: List[str]
+) -> _Export:
+    """Блоки версии таблицы со столбцами names; недостающие копируются.
+
+    Вызывающий отпускает их через _release().
+    """
+    with _exports_lock:
+        export = _exports.get(table_name)
+        if export is None or (export.version, export.rows) != (
+            version, len(store)
+        ):
+            if export is not None:
+                _retire(export)
+            export = _exports[table_name] = _Export(version, len(store))
+        missing = [name for name in names if name not in export.columns]
+        try:
+            export.columns.update(_export(store, missing, export.blocks))
+            if export.alive is None:
+                export.alive = _share(store.alive[:len(store)], export.blocks)
+        except OSError:
+            del _exports[table_name]
+            _retire(export)
+            raise
+        export.users += 1
+        return export
+
+
+def _release(export: _Export) -> None:
+    with _exports_lock:
+        export.users -= 1
+        if export.retired and not export.users:
+            export.release()
+
+
+def matching_positions(
+    expr: Expr, store: ColumnStore, table_name: str, version: int
+) -> Optional[List[int]]:
+    """Позиции живых строк под условием или None, если скан - серийный.
+
+    version - версия таблицы: пока она та же, блоки общей памяти
+    переиспользуются.
+    """
+    rows = len(store)
+    count = min(partitions(), rows)
+    if count < 2 or rows < _settings['min_rows'] or expr.source is None:
+        return None
+
+    export = None
+    try:
+        names = sorted(columns(expr))
+        export = _acquire(store, table_name, version, names)
+        layout = {name: export.columns[name] for name in names}
+        alive = export.alive
+        schema = list(store.schema)
+        bounds = [rows * part // count for part in range(count + 1)]
+        futures = [
+            _executor().submit(
+                scan_range, expr.source, schema, table_name,
+                layout, alive, rows, start, stop,
+            )
+            for start, stop in zip(bounds, bounds[1:])
+        ]
+        positions = array('q')
+        for future in futures:
+            positions.frombytes(future.result())
+        return positions.tolist()
+    except (OSError, BrokenProcessPool):
+        # Процесс пула упал или нет общей памяти: скан в этом процессе
+        _drop_pool()
+        return None
+    finally:
+        if export is not None:
+            _release(export)
+
+
+def scan_range(
+    condition: str,
+    schema: List[Tuple[str, str]],
+    table_name: str,
+    layout: Dict[str, ColumnBlocks],
+    alive_block: str,
+    rows: int,
+    start: int,
+    stop: int,
+) -> bytes:
+    """Процесс пула: позиции диапазона [start, stop) под условием."""
+    expr = compile_condition(condition, dict(schema), table_name)
+    blocks: List[SharedMemory] = []
+    views: List[memoryview] = []
+
+    def attach(name: str) -> memoryview:
+        block = SharedMemory(name=name)
+        blocks.append(block)
+        return block.buf
+
+    try:
+        store = ColumnStore(schema)
+        for name, (col_type, values, dictionary) in layout.items():
+            view = attach(values)
+            if col_type == 'bool':
+                views.append(view[:rows])
+                store.columns[name] = BoolColumn.from_buffer(views[-1])
+                continue
+            views.append(view[:rows * 8].cast('q'))
+            if col_type == 'int':
+                store.columns[name] = IntColumn.from_buffer(views[-1])
+            else:
+                words = pickle.loads(attach(dictionary))
+                store.columns[name] = StrColumn.from_buffer(views[-1], words)
+        alive = bytes(attach(alive_block)[start:stop])
+        predicate = expr.bind(store)
+
+        found = array('q')
+        find = alive.find
+        offset = find(1)
+        while offset != -1:
+            if predicate(start + offset):
+                found.append(start + offset)
+            offset = find(1, offset + 1)
+        return found.tobytes()
+    finally:
+        store = predicate = None
+        for view in views:
+            view.release()
+        for block in blocks:
+            block.close()
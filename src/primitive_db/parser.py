@@ -2,17 +2,58 @@
 
 # Парсинг команд базы данных бд
 
+import re
 import shlex
 from typing import List, Optional, Tuple
 
+from src.primitive_db.constants import WRITE_COMMANDS
+
+WHERE_PATTERN = re.compile(r'\swhere\s', re.IGNORECASE)
+
+# limit n [offset m] в конце select
+LIMIT_PATTERN = re.compile(
+    r'^(?P<head>.*)\slimit\s+(?P<limit>\d+)(?:\s+offset\s+(?P<offset>\d+))?\s*$',
+    re.IGNORECASE | re.DOTALL,
+)
+
+# Хвост условия в copy ... where <условие> to <файл> [csv|jsonl]
+COPY_TO_PATTERN = re.compile(
+    r'^(?P<condition>.*)\s+to\s+(?P<file>\S+)(?:\s+(?P<format>csv|jsonl))?\s*$',
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+def split_where(user_input: str) -> Tuple[str, Optional[str]]:
+    """Отделяет условие после ключевого слова where (вне кавычек).
+
+    Условие возвращается как есть, с кавычками: его разбирает
+    conditions.compile_condition.
+    """
+    quote = None
+    for position, char in enumerate(user_input):
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif WHERE_PATTERN.match(user_input, position):
+            return user_input[:position], user_input[position + 6:].strip()
+    return user_input, None
+
 
 def parse_command(user_input: str) -> Tuple[str, List[str]]:
-    """Разбирает пользовательский ввод на команду и аргументы."""
+    """Разбирает пользовательский ввод на команду и аргументы.
+    
+    Всё после where остаётся одним аргументом.
+    """
     if not user_input.strip():
         return "", []
     
     try:
-        args = shlex.split(user_input)
+        head, where_clause = split_where(user_input)
+        args = shlex.split(head)
+        if where_clause is not None:
+            args += ["where", where_clause]
         command = args[0].lower()
         arguments = args[1:]
         return command, arguments
@@ -20,6 +61,30 @@ def parse_command(user_input: str) -> Tuple[str, List[str]]:
         raise ValueError(f"Ошибка парсинга команды: {e}")
 
 
+def is_write_command(command: str, args: List[str]) -> bool:
+    """Меняет ли команда базу (нужна ли исключительная блокировка)."""
+    if command == "copy":
+        return len(args) > 1 and args[1].lower() == "from"
+    return command in WRITE_COMMANDS
+
+
+def read_tables(command: str, args: List[str]) -> List[str]:
+    """Таблицы, строки которых читает команда (для снимков чтения)."""
+    try:
+        if command == "select" and is_join_select(args):
+            return list(dict.fromkeys(parse_join(args)[:2]))
+        if command == "select" and is_aggregate_select(args):
+            return [parse_aggregate(args)[0]]
+        if command == "select":
+            return [parse_select(args)[0]]
+        if command == "copy":
+            return [parse_copy(args)[0]]
+    except ValueError:
+        # Ошибку разбора сообщит сама команда
+        pass
+    return []
+
+
 def parse_create_table(args: List[str]) -> Tuple[str, List[str]]:
     """Парсит аргументы команды create_table"""
     if len(args) < 1:
@@ -59,23 +124,200 @@ def parse_insert(args: List[str]) -> Tuple[str, List[str]]:
     return table_name, values
 
 
-def parse_select(args: List[str]) -> Tuple[str, Optional[str]]:
-    """Парсит аргументы команды select"""
+def parse_select(
+    args: List[str],
+) -> Tuple[str, Optional[List[str]], Optional[str], Optional[int], int]:
+    """Парсит аргументы команды select.
+
+    select [столбец, ... from] <таблица> [where условие]
+    [limit n [offset m]]
+
+    Возвращает таблицу, столбцы (None - все), условие, limit и offset.
+    """
+    usage = (
+        "Используйте: select [столбец, ... from] <имя_таблицы> "
+        "[where условие] [limit n [offset m]]"
+    )
     if len(args) < 1:
-        raise ValueError(
-            "Недостаточно аргументов. "
-            "Используйте: select <имя_таблицы> [where условие]"
-        )
+        raise ValueError(f"Недостаточно аргументов. {usage}")
     
-    table_name = args[0]
+    columns = None
+    lowered = [arg.lower() for arg in args]
+    if "from" in lowered:
+        at = lowered.index("from")
+        columns = _split_list(args[:at])
+        if not columns or at + 1 >= len(args):
+            raise ValueError(f"Недостаточно аргументов. {usage}")
+        if columns == ["*"]:
+            columns = None
+        args = args[at + 1:]
+    
+    table_name, tail = args[0], args[1:]
     condition = None
+    limit, offset = None, 0
     
-    if len(args) >= 3 and args[1].lower() == "where":
-        condition = args[2]
-    elif len(args) >= 2:
-        condition = args[1]
+    if len(tail) >= 2 and tail[0].lower() == "where":
+        condition = tail[1]
+        match = LIMIT_PATTERN.match(" " + condition)
+        if match:
+            condition = match.group("head").strip()
+            limit, offset = _limit_offset(match)
+    elif tail:
+        match = LIMIT_PATTERN.match(" " + " ".join(tail))
+        if match and not match.group("head").strip():
+            limit, offset = _limit_offset(match)
+        elif len(tail) == 1:
+            condition = tail[0]
+        else:
+            raise ValueError(f"Некорректный select. {usage}")
     
-    return table_name, condition
+    return table_name, columns, condition or None, limit, offset
+
+
+def _limit_offset(match: re.Match) -> Tuple[int, int]:
+    """limit и offset из совпадения LIMIT_PATTERN."""
+    offset = match.group("offset")
+    return int(match.group("limit")), int(offset) if offset else 0
+
+
+def is_aggregate_select(args: List[str]) -> bool:
+    """Является ли select запросом с агрегатами (count(*) ... from)."""
+    lowered = [arg.lower() for arg in args]
+    if "from" not in lowered:
+        return False
+    items = _split_list(args[:lowered.index("from")])
+    return any(AGGREGATE_PATTERN.match(item) for item in items)
+
+
+AGGREGATE_PATTERN = re.compile(r'^(\w+)\s*\(\s*(\*|\w+)\s*\)$')
+
+
+def _split_list(tokens: List[str]) -> List[str]:
+    """Элементы списка через запятую, разбитого shlex на токены."""
+    return [item.strip() for item in " ".join(tokens).split(",") if item.strip()]
+
+
+def parse_aggregate(
+    args: List[str],
+) -> Tuple[str, List[Tuple[str, Optional[str]]], List[str], Optional[str]]:
+    """Парсит select с агрегатами.
+
+    select count(*), avg(age) from <таблица> [group by столбец, ...]
+    [where условие]
+    """
+    usage = (
+        "Используйте: select count(*), avg(<столбец>) from <таблица> "
+        "[group by <столбец>] [where условие]"
+    )
+    lowered = [arg.lower() for arg in args]
+    if "from" not in lowered or lowered.index("from") + 1 >= len(args):
+        raise ValueError(f"Недостаточно аргументов. {usage}")
+
+    at = lowered.index("from")
+    aggregates = []
+    for item in _split_list(args[:at]):
+        match = AGGREGATE_PATTERN.match(item)
+        if not match:
+            raise ValueError(f'Некорректный агрегат: "{item}". {usage}')
+        func, column = match.group(1).lower(), match.group(2)
+        aggregates.append((func, None if column == "*" else column))
+    if not aggregates:
+        raise ValueError(f"Не указаны агрегаты. {usage}")
+
+    table_name = args[at + 1]
+    rest, lowered_rest = args[at + 2:], lowered[at + 2:]
+    condition = None
+    if "where" in lowered_rest:
+        where_at = lowered_rest.index("where")
+        condition = " ".join(rest[where_at + 1:]) or None
+        rest, lowered_rest = rest[:where_at], lowered_rest[:where_at]
+
+    group_by = []
+    if rest:
+        if lowered_rest[:2] != ["group", "by"] or len(rest) < 3:
+            raise ValueError(f"Некорректный group by. {usage}")
+        group_by = _split_list(rest[2:])
+
+    return table_name, aggregates, group_by, condition
+
+
+def is_join_select(args: List[str]) -> bool:
+    """Является ли select соединением двух таблиц (... join ... on ...)."""
+    if len(args) >= 2 and args[-2].lower() == "where":
+        args = args[:-2]
+    return any(arg.lower() == "join" for arg in args)
+
+
+JOIN_ON_PATTERN = re.compile(r'^(?P<first>[^\s=]+)\s*==\s*(?P<second>[^\s=]+)$')
+
+
+def parse_join(
+    args: List[str],
+) -> Tuple[
+    str, str, str, str, Optional[List[str]], Optional[str], Optional[int], int
+]:
+    """Парсит select с соединением двух таблиц.
+
+    select [столбец, ... from] <таблица> join <таблица>
+    on <таблица>.<столбец> == <таблица>.<столбец> [where условие]
+    [limit n [offset m]]
+
+    Возвращает левую и правую таблицы, столбцы соединения левой и правой,
+    столбцы результата (None - все), условие, limit и offset.
+    """
+    usage = (
+        "Используйте: select [столбец, ... from] <таблица> join <таблица> "
+        "on <таблица>.<столбец> == <таблица>.<столбец> [where условие] "
+        "[limit n [offset m]]"
+    )
+    columns = None
+    lowered = [arg.lower() for arg in args]
+    if "from" in lowered:
+        at = lowered.index("from")
+        columns = _split_list(args[:at])
+        if not columns:
+            raise ValueError(f"Недостаточно аргументов. {usage}")
+        if columns == ["*"]:
+            columns = None
+        args, lowered = args[at + 1:], lowered[at + 1:]
+
+    condition = None
+    if len(args) >= 2 and lowered[-2] == "where":
+        condition = args[-1]
+        args, lowered = args[:-2], lowered[:-2]
+    if len(args) < 5 or lowered[1] != "join" or lowered[3] != "on":
+        raise ValueError(f"Некорректный join. {usage}")
+
+    left, right = args[0], args[2]
+    if left == right:
+        raise ValueError("Соединение таблицы с самой собой не поддерживается.")
+    on_clause = " ".join(args[4:])
+    limit, offset = None, 0
+    source = " " + (condition if condition is not None else on_clause)
+    match = LIMIT_PATTERN.match(source)
+    if match:
+        limit, offset = _limit_offset(match)
+        if condition is not None:
+            condition = match.group("head").strip()
+        else:
+            on_clause = match.group("head").strip()
+
+    on = JOIN_ON_PATTERN.match(on_clause.strip())
+    if not on:
+        raise ValueError(f'Некорректное условие соединения: "{on_clause}". {usage}')
+    sides = {}
+    for name in on.group("first", "second"):
+        table_name, _, column = name.partition(".")
+        if table_name not in (left, right) or table_name in sides or not column:
+            raise ValueError(
+                f'Некорректное условие соединения: "{on_clause}". {usage}'
+            )
+        sides[table_name] = column
+
+    return (
+        left, right, sides[left], sides[right],
+        columns, condition or None, limit, offset,
+    )
 
 
 def parse_update(args: List[str]) -> Tuple[str, str, Optional[str]]:
@@ -134,12 +376,66 @@ def parse_delete(args: List[str]) -> Tuple[str, Optional[str]]:
     return table_name, where_clause
 
 
-def validate_condition(condition: str) -> bool:
-    """Проверяет корректность условия WHERE."""
-    import re
+def parse_copy(
+    args: List[str],
+) -> Tuple[str, str, str, Optional[str], Optional[str]]:
+    """Парсит аргументы команды copy.
+
+    Возвращает таблицу, направление (from/to), файл, формат и условие:
+    copy <таблица> from <файл>
+    copy <таблица> [where условие] to <файл> [csv|jsonl]
+    """
+    usage = (
+        "Используйте: copy <таблица> from <файл.csv|файл.jsonl> или "
+        "copy <таблица> [where условие] to <файл> [csv|jsonl]"
+    )
+    if len(args) < 3:
+        raise ValueError(f"Недостаточно аргументов. {usage}")
+    
+    table_name, direction = args[0], args[1].lower()
+    if direction == "from" and len(args) == 3:
+        return table_name, direction, args[2], None, None
+    
+    if direction == "where" and len(args) == 3:
+        match = COPY_TO_PATTERN.match(args[2])
+        if not match:
+            raise ValueError(f"Не указан файл для выгрузки. {usage}")
+        file_format = match.group("format")
+        return (
+            table_name,
+            "to",
+            match.group("file"),
+            file_format.lower() if file_format else None,
+            match.group("condition"),
+        )
     
-    if not condition:
-        return True
+    if direction == "to" and len(args) in (3, 4):
+        file_format = args[3].lower() if len(args) == 4 else None
+        if file_format not in (None, "csv", "jsonl"):
+            raise ValueError(f'Неизвестный формат: "{args[3]}". {usage}')
+        return table_name, direction, args[2], file_format, None
+    
+    raise ValueError(f"Неверные аргументы. {usage}")
+
+
+def parse_create_index(args: List[str]) -> Tuple[str, str, str]:
+    """Парсит аргументы команды create_index."""
+    if len(args) not in (2, 3):
+        raise ValueError(
+            "Неверное количество аргументов. "
+            "Используйте: create_index <таблица> <столбец> [hash|sorted]"
+        )
+    
+    kind = args[2].lower() if len(args) == 3 else "hash"
+    return args[0], args[1], kind
+
+
+def parse_drop_index(args: List[str]) -> Tuple[str, str]:
+    """Парсит аргументы команды drop_index."""
+    if len(args) != 2:
+        raise ValueError(
+            "Неверное количество аргументов. "
+            "Используйте: drop_index <таблица> <столбец>"
+        )
     
-    pattern = r'^\w+[<>=!]+\S+$'
-    return bool(re.match(pattern, condition))
+    return args[0], args[1]
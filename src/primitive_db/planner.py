@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Планировщик WHERE: выбор индекса и остаточный фильтр.
+"""
+from typing import Iterator, List, Optional, Tuple
+
+from src.primitive_db import parallel, vectorized
+from src.primitive_db.conditions import Access, Expr, all_of, conjuncts
+from src.primitive_db.table import Table
+
+
+def choose_access(
+    table: Table, expr: Expr
+) -> Tuple[Optional[Access], List[Expr]]:
+    """Самое селективное слагаемое AND, отвечаемое индексом.
+
+    Возвращает запрос к индексу (или None для полного скана) и
+    оставшиеся слагаемые, которые проверяются на каждой строке.
+    """
+    parts = conjuncts(expr)
+    best = None
+    for number, part in enumerate(parts):
+        access = part.access()
+        if access is None:
+            continue
+        estimate = table.estimate(*access)
+        if estimate is not None and (best is None or estimate < best[0]):
+            best = (estimate, number, access)
+
+    if best is None:
+        return None, parts
+
+    _, chosen, access = best
+    residual = [part for number, part in enumerate(parts) if number != chosen]
+    return access, residual
+
+
+def matching_positions(table: Table, expr: Expr) -> List[int]:
+    """Позиции строк, удовлетворяющих условию."""
+    access, residual = choose_access(table, expr)
+
+    store = table.store
+
+    if access is None:
+        # NumPy в одном процессе быстрее Python-предиката на всех ядрах:
+        # пул процессов - для условий, которые векторно не считаются
+        positions = vectorized.matching_positions(expr, store)
+        if positions is None:
+            positions = parallel.matching_positions(
+                expr, store, table.name, table.version
+            )
+        if positions is None:
+            predicate = expr.bind(store)
+            positions = [
+                position for position in store.positions()
+                if predicate(position)
+            ]
+        return table.in_order(positions)
+
+    positions = table.lookup(*access)
+    if residual:
+        predicate = all_of([part.bind(store) for part in residual])
+        positions = [position for position in positions if predicate(position)]
+    return table.in_order(positions)
+
+
+def iter_positions(table: Table, expr: Expr) -> Iterator[int]:
+    """Как matching_positions, но полный скан отдаёт позиции по одной.
+
+    Пока порядок позиций не совпадает с порядком ID, скан тоже
+    собирается целиком и сортируется.
+    """
+    access, residual = choose_access(table, expr)
+    if access is not None or table.reordered:
+        yield from matching_positions(table, expr)
+        return
+
+    predicate = expr.bind(table.store)
+    for position in table.store.positions():
+        if predicate(position):
+            yield position
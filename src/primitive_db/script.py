@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Пакетный режим: project exec <script.sql> и project -c "<cmd>; <cmd>".
+
+Скрипт целиком разбирается до выполнения: команды разделяются точкой с
+запятой или переводом строки (вне кавычек), строки, начинающиеся с
+"--", - комментарии. Ошибка разбора останавливает скрипт до первой
+команды. Выполнение идёт в одной сессии под одной блокировкой, без
+подтверждений; изменения сохраняются один раз в конце или на командах
+commit. Транзакция, не завершённая к концу скрипта, откатывается. exit
+завершает скрипт досрочно.
+"""
+from typing import List, Tuple
+
+from src.primitive_db.constants import DATA_DIR, METADATA_FILE
+from src.primitive_db.decorators import unattended
+from src.primitive_db.engine import execute
+from src.primitive_db.parser import is_write_command, parse_command
+from src.primitive_db.session import Database
+
+COMMENT_PREFIX = "--"
+
+
+def split_statements(text: str) -> List[str]:
+    """Делит текст скрипта на команды по ; и переводам строк вне кавычек."""
+    statements = []
+    current: List[str] = []
+    quote = None
+    for char in text:
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char in ";\n":
+            statements.append("".join(current))
+            current = []
+            continue
+        current.append(char)
+    statements.append("".join(current))
+    return [
+        statement.strip() for statement in statements
+        if statement.strip()
+        and not statement.strip().startswith(COMMENT_PREFIX)
+    ]
+
+
+def parse_script(text: str) -> List[Tuple[str, List[str]]]:
+    """Разбирает все команды скрипта или сообщает о первой ошибке."""
+    commands = []
+    for number, statement in enumerate(split_statements(text), 1):
+        try:
+            commands.append(parse_command(statement))
+        except ValueError as e:
+            raise ValueError(f"Команда {number} ({statement}): {e}")
+    return commands
+
+
+def run_script(
+    text: str,
+    metadata_file: str = METADATA_FILE,
+    data_dir: str = DATA_DIR,
+) -> int:
+    """Выполняет скрипт; возвращает код выхода.
+
+    0 - скрипт разобран и изменения сохранены.
+    """
+    try:
+        commands = parse_script(text)
+    except ValueError as e:
+        print(f"{e}")
+        return 1
+
+    exclusive = any(
+        is_write_command(command, args) for command, args in commands
+    )
+    db = Database(metadata_file, data_dir)
+    db.deferred = True
+    metadata = db.acquire(exclusive)
+    try:
+        try:
+            with unattended():
+                for command, args in commands:
+                    if command == "exit":
+                        break
+                    try:
+                        execute(db, metadata, command, args)
+                    except Exception as e:
+                        print(f" Неожиданная ошибка: {e}")
+            if db.transaction is not None:
+                db.rollback()
+                print("Незавершённая транзакция отменена.")
+            db.commit()
+        finally:
+            db.release()
+            db.close()
+    except ValueError as e:
+        # Изменения не записаны
+        print(f"{e}")
+        return 1
+    return 0
+
+
+def run_file(filepath: str, **kwargs) -> int:
+    """Выполняет скрипт из файла."""
+    try:
+        with open(filepath, 'r', encoding='utf-8') as file:
+            text = file.read()
+    except OSError as e:
+        print(f'Не удалось прочитать скрипт "{filepath}": {e}')
+        return 1
+    return run_script(text, **kwargs)
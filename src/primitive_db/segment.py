@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Бинарный формат сегмента таблицы (.seg).
+
+    заголовок   magic, версия, число столбцов и строк, смещение кучи,
+                последний выданный ID
+    каталог     по записи фиксированной длины на столбец
+    блоки       данные столбцов, выровненные по 8 байт:
+                int  - int64 на строку
+                bool - байт на строку
+                str  - int64-код на строку и смещения строк словаря
+    куча        имена столбцов и строки словарей в utf-8
+
+Числа записываются в порядке little-endian. Файл открывается через
+mmap: чтение заголовка и каталога не зависит от размера таблицы, а
+блоки столбцов становятся memoryview и читаются страницами по мере
+обращения.
+
+Последний выданный ID записывается вместе с данными: каталог
+сохраняется после сегмента и после сбоя между ними может отстать.
+"""
+import mmap
+import struct
+import sys
+from array import array
+from typing import BinaryIO, List, Optional, Tuple, Union
+
+from src.primitive_db.columnar import (
+    BoolColumn,
+    ColumnStore,
+    IntColumn,
+    StrColumn,
+)
+
+MAGIC = b"PDBSEG\x00\x01"
+VERSION = 2
+
+# magic, версия, число столбцов, число строк, смещение кучи, счётчик ID
+HEADER = struct.Struct("<8sIIQQQ")
+# Заголовок версии 1 - без счётчика ID
+HEADER_V1 = struct.Struct("<8sIIQQ")
+# тип, смещение и длина имени в куче, смещение блока, размер словаря
+ENTRY = struct.Struct("<B7xQQQQ")
+
+TYPE_CODES = {"int": 1, "bool": 2, "str": 3}
+TYPE_NAMES = {code: name for name, code in TYPE_CODES.items()}
+
+
+def _aligned(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def _int64_bytes(values: Union[array, memoryview]) -> bytes:
+    """Буфер int64 в порядке little-endian."""
+    if sys.byteorder != "little":
+        swapped = array("q")
+        swapped.frombytes(values)
+        swapped.byteswap()
+        return swapped.tobytes()
+    return values.tobytes()
+
+
+def write_segment(
+    file: BinaryIO, store: ColumnStore, sequence: int = 0
+) -> None:
+    """Записывает живые строки хранилища в открытый файл сегмента.
+
+    sequence - последний выданный ID таблицы.
+    """
+    if len(store) and store.alive.count(0):
+        store = store.compact()
+    rows = len(store)
+
+    heap = bytearray()
+
+    def to_heap(text: str) -> Tuple[int, int]:
+        data = text.encode("utf-8")
+        heap.extend(data)
+        return len(heap) - len(data), len(data)
+
+    blocks: List[Tuple[int, bytes]] = []
+    entries = []
+    offset = HEADER.size + ENTRY.size * len(store.schema)
+    for name, col_type in store.schema:
+        column = store.columns[name]
+        name_offset, name_length = to_heap(name)
+        dictionary_size = 0
+        if col_type == "int":
+            block = _int64_bytes(column.data)
+        elif col_type == "bool":
+            block = bytes(column.data)
+        else:
+            dictionary_size = len(column.dictionary)
+            bounds = array("q", [len(heap)])
+            for value in column.dictionary:
+                to_heap(value)
+                bounds.append(len(heap))
+            block = _int64_bytes(column.codes) + _int64_bytes(bounds)
+        offset = _aligned(offset)
+        entries.append(
+            (TYPE_CODES[col_type], name_offset, name_length, offset,
+             dictionary_size)
+        )
+        blocks.append((offset, block))
+        offset += len(block)
+    heap_offset = _aligned(offset)
+
+    file.write(
+        HEADER.pack(MAGIC, VERSION, len(entries), rows, heap_offset, sequence)
+    )
+    written = HEADER.size
+    for entry in entries:
+        written += file.write(ENTRY.pack(*entry))
+    for block_offset, block in blocks:
+        written += file.write(b"\x00" * (block_offset - written))
+        written += file.write(block)
+    file.write(b"\x00" * (heap_offset - written))
+    file.write(heap)
+
+
+def read_segment(
+    filepath: str, columns: List[Tuple[str, str]]
+) -> Tuple[ColumnStore, Optional[int]]:
+    """Открывает сегмент через mmap и собирает хранилище по схеме.
+
+    Возвращает хранилище и последний выданный ID (None для сегмента
+    версии 1, где его нет).
+    """
+    with open(filepath, "rb") as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+
+    magic, version = HEADER_V1.unpack_from(view, 0)[:2]
+    if magic != MAGIC or version not in (1, VERSION):
+        raise ValueError(f'Файл "{filepath}" не является сегментом таблицы')
+    if version == 1:
+        _, _, count, rows, heap_offset = HEADER_V1.unpack_from(view, 0)
+        header_size, sequence = HEADER_V1.size, None
+    else:
+        _, _, count, rows, heap_offset, sequence = HEADER.unpack_from(view, 0)
+        header_size = HEADER.size
+
+    def int64_view(offset: int, length: int) -> memoryview:
+        block = view[offset:offset + 8 * length].cast("q")
+        if sys.byteorder != "little":
+            swapped = array("q", block)
+            swapped.byteswap()
+            return memoryview(swapped)
+        return block
+
+    def from_heap(offset: int, length: int) -> str:
+        start = heap_offset + offset
+        return str(view[start:start + length], "utf-8")
+
+    found = {}
+    for number in range(count):
+        type_code, name_offset, name_length, offset, dictionary_size = (
+            ENTRY.unpack_from(view, header_size + ENTRY.size * number)
+        )
+        name = from_heap(name_offset, name_length)
+        col_type = TYPE_NAMES[type_code]
+        if col_type == "int":
+            column = IntColumn.from_buffer(int64_view(offset, rows))
+        elif col_type == "bool":
+            column = BoolColumn.from_buffer(view[offset:offset + rows])
+        else:
+            bounds = int64_view(offset + 8 * rows, dictionary_size + 1)
+            dictionary = [
+                from_heap(bounds[code], bounds[code + 1] - bounds[code])
+                for code in range(dictionary_size)
+            ]
+            column = StrColumn.from_buffer(int64_view(offset, rows), dictionary)
+        found[name] = (col_type, column)
+
+    store = ColumnStore(columns)
+    for name, col_type in store.schema:
+        if found.get(name, (None,))[0] != col_type:
+            raise ValueError(
+                f'Сегмент "{filepath}" не соответствует схеме: столбец "{name}"'
+            )
+        store.columns[name] = found[name][1]
+    store.init_versions(rows)
+    return store, sequence
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Сетевой режим: project serve --port N.
+
+База один раз загружается в память процесса, клиенты подключаются по
+TCP. Протокол строковый, в utf-8: клиент шлёт команду одной строкой (тот
+же язык, что в консоли), сервер отвечает её выводом и строкой
+END_OF_REPLY. Строки вывода, которые начинаются с точки, получают ещё
+одну точку в начале. exit закрывает соединение. Каждая команда
+сохраняется сразу: begin/commit/rollback здесь не поддерживаются.
+
+Изменения проходят через одну задачу-писателя и выполняются по одному.
+Чтение через AccessGate только берёт снимки таблиц, а выполняется в
+пуле потоков параллельно с другими чтениями и с записью. Подтверждения
+не спрашиваются, select выводится целиком.
+"""
+import asyncio
+import io
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, TextIO, Tuple
+
+from src.primitive_db.constants import (
+    DATA_DIR,
+    FLUSH_MAX_DELAY,
+    METADATA_FILE,
+    SERVER_HOST,
+    SERVER_PORT,
+    TRANSACTION_COMMANDS,
+)
+from src.primitive_db.decorators import unattended
+from src.primitive_db.engine import execute
+from src.primitive_db.parser import (
+    is_write_command,
+    parse_command,
+    read_tables,
+)
+from src.primitive_db.session import Database, close_snapshot
+from src.primitive_db.table import Table
+
+END_OF_REPLY = "."
+
+
+class ThreadOutput(io.TextIOBase):
+    """sys.stdout, который пишет в буфер текущего потока, если он задан.
+
+    Так вывод команды, выполняемой в пуле, уходит её клиенту.
+    """
+
+    def __init__(self, default: TextIO) -> None:
+        self.default = default
+        self.local = threading.local()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        buffer = getattr(self.local, 'buffer', None)
+        return (buffer or self.default).write(text)
+
+    def flush(self) -> None:
+        if getattr(self.local, 'buffer', None) is None:
+            self.default.flush()
+
+
+def frame(reply: str) -> bytes:
+    """Ответ для клиента: строки с экранированной точкой и терминатор."""
+    lines = [
+        "." + line if line.startswith(".") else line
+        for line in reply.splitlines()
+    ]
+    lines.append(END_OF_REPLY)
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class AccessGate:
+    """Снимки для чтений берутся параллельно, запись - одна и без них.
+
+    Первый читатель берёт shared-блокировку базы, последний её снимает;
+    запись идёт под exclusive. Ждущая запись не пропускает новые чтения.
+    Database вызывается только отсюда, под condition, по очереди.
+    """
+
+    def __init__(self, db: Database) -> None:
+        self.db = db
+        self.readers = 0
+        self.writing = False
+        self.waiting_writers = 0
+        self.condition = asyncio.Condition()
+
+    async def start_read(self) -> None:
+        async with self.condition:
+            await self.condition.wait_for(
+                lambda: not self.writing and not self.waiting_writers
+            )
+            if self.readers == 0:
+                await asyncio.to_thread(self.db.acquire, False)
+            self.readers += 1
+
+    async def end_read(self) -> None:
+        async with self.condition:
+            self.readers -= 1
+            if self.readers == 0:
+                await asyncio.to_thread(self.db.release)
+            self.condition.notify_all()
+
+    async def start_write(self) -> None:
+        async with self.condition:
+            self.waiting_writers += 1
+            await self.condition.wait_for(lambda: self.readers == 0)
+            self.waiting_writers -= 1
+            self.writing = True
+            await asyncio.to_thread(self.db.acquire, True)
+
+    async def end_write(self) -> None:
+        async with self.condition:
+            await asyncio.to_thread(self.db.release)
+            self.writing = False
+            self.condition.notify_all()
+
+
+class Server:
+    """TCP-сервер поверх одной загруженной базы."""
+
+    def __init__(self, db: Database, output: ThreadOutput) -> None:
+        self.db = db
+        self.output = output
+        self.gate = AccessGate(db)
+        self.writes: asyncio.Queue = asyncio.Queue()
+        self.read_pool = ThreadPoolExecutor(thread_name_prefix="db-read")
+        self.write_pool = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="db-write"
+        )
+
+    def run_command(
+        self,
+        command: str,
+        args: List[str],
+        metadata: Optional[Dict[str, Table]] = None,
+    ) -> str:
+        """Выполняет команду в текущем потоке и возвращает её вывод.
+
+        metadata - каталог со снимками для чтения, по умолчанию текущий.
+        """
+        if metadata is None:
+            metadata = self.db.metadata
+        buffer = io.StringIO()
+        self.output.local.buffer = buffer
+        try:
+            with unattended():
+                execute(self.db, metadata, command, args)
+        except Exception as e:
+            print(f" Неожиданная ошибка: {e}")
+        finally:
+            self.output.local.buffer = None
+        return buffer.getvalue()
+
+    async def writer(self) -> None:
+        """Единственная задача, которая выполняет изменения."""
+        loop = asyncio.get_running_loop()
+        while True:
+            command, args, reply = await self.writes.get()
+            await self.gate.start_write()
+            try:
+                output = await loop.run_in_executor(
+                    self.write_pool, self.run_command, command, args
+                )
+            finally:
+                await self.gate.end_write()
+            if not reply.cancelled():
+                reply.set_result(output)
+
+    async def handle(self, user_input: str) -> Optional[str]:
+        """Ответ на одну строку клиента; None - закрыть соединение."""
+        try:
+            command, args = parse_command(user_input)
+        except ValueError as e:
+            return f"{e}\n"
+        if command == "exit":
+            return None
+        if command in TRANSACTION_COMMANDS:
+            # Сессия общая для всех клиентов: транзакция одного клиента
+            # захватила бы изменения остальных
+            return "Транзакции в сетевом режиме не поддерживаются.\n"
+
+        loop = asyncio.get_running_loop()
+        if is_write_command(command, args):
+            reply = loop.create_future()
+            await self.writes.put((command, args, reply))
+            return await reply
+
+        await self.gate.start_read()
+        try:
+            catalog = await loop.run_in_executor(
+                self.read_pool, self.db.snapshot, read_tables(command, args)
+            )
+        finally:
+            await self.gate.end_read()
+        try:
+            return await loop.run_in_executor(
+                self.read_pool, self.run_command, command, args, catalog
+            )
+        finally:
+            close_snapshot(catalog)
+
+    async def client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Обслуживает одно соединение: команда - ответ."""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                user_input = line.decode("utf-8", errors="replace").strip()
+                if not user_input:
+                    continue
+                reply = await self.handle(user_input)
+                if reply is None:
+                    break
+                writer.write(frame(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int) -> None:
+        writer_task = asyncio.create_task(self.writer())
+        server = await asyncio.start_server(self.client, host, port)
+        addresses = ", ".join(
+            "{}:{}".format(*sock.getsockname()[:2]) for sock in server.sockets
+        )
+        self.output.default.write(f"Сервер базы данных слушает {addresses}\n")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            writer_task.cancel()
+
+
+def serve(
+    host: str = SERVER_HOST,
+    port: int = SERVER_PORT,
+    metadata_file: str = METADATA_FILE,
+    data_dir: str = DATA_DIR,
+) -> None:
+    """Запускает сервер до Ctrl+C; изменения сохраняются при выходе."""
+    output = ThreadOutput(sys.stdout)
+    sys.stdout = output
+    db: Optional[Database] = None
+    try:
+        db = Database(metadata_file, data_dir, FLUSH_MAX_DELAY)
+        server = Server(db, output)
+        asyncio.run(server.serve(host, port))
+    except KeyboardInterrupt:
+        print("\n Сервер остановлен.")
+    except OSError as e:
+        print(f"Не удалось запустить сервер: {e}")
+    finally:
+        if db is not None:
+            try:
+                db.close()
+            except ValueError as e:
+                print(f"{e}")
+        sys.stdout = output.default
+
+
+def request(
+    user_input: str, host: str = SERVER_HOST, port: int = SERVER_PORT
+) -> str:
+    """Отправляет одну команду серверу и возвращает ответ (для скриптов)."""
+    return asyncio.run(_request([user_input], host, port))[0]
+
+
+async def _request(
+    commands: List[str], host: str, port: int
+) -> Tuple[str, ...]:
+    reader, writer = await asyncio.open_connection(host, port)
+    replies = []
+    try:
+        for user_input in commands:
+            writer.write(user_input.encode("utf-8") + b"\n")
+            await writer.drain()
+            lines = []
+            while True:
+                line = (await reader.readline()).decode("utf-8")
+                if not line or line.rstrip("\n") == END_OF_REPLY:
+                    break
+                line = line.rstrip("\n")
+                lines.append(line[1:] if line.startswith("..") else line)
+            replies.append("\n".join(lines))
+    finally:
+        writer.close()
+    return tuple(replies)
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+Сессия базы данных: каталог и данные таблиц в памяти.
+
+Несколько процессов могут работать с одной базой: команда выполняется
+между acquire и release - под shared-блокировкой для чтения или
+exclusive для записи. Процесс, чей каталог отстал от версии базы на
+диске, перечитывает его перед командой.
+
+Чтение держит блокировку только пока берёт снимки таблиц (snapshot) и
+дальше идёт без неё: изменения, сделанные после снимка, ему не видны.
+"""
+import copy
+from functools import partial
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from src.primitive_db import parallel
+from src.primitive_db.columnar import ColumnStore
+from src.primitive_db.constants import (
+    DATA_DIR,
+    ERROR_WRITE_FAILED,
+    FLUSH_MAX_DELAY,
+    METADATA_FILE,
+)
+from src.primitive_db.table import Table, TableSnapshot, operation_size
+from src.primitive_db.utils import (
+    StorageLock,
+    load_metadata,
+    load_table_data,
+    load_wal,
+)
+from src.primitive_db.writer import (
+    BackgroundWriter,
+    Task,
+    coalesce,
+    write_tasks,
+)
+
+
+class Database:
+    """Держит загруженный каталог в памяти и сохраняет только
+    изменённые таблицы."""
+
+    def __init__(
+        self,
+        metadata_file: str = METADATA_FILE,
+        data_dir: str = DATA_DIR,
+        flush_delay: float = FLUSH_MAX_DELAY,
+    ) -> None:
+        self.metadata_file = metadata_file
+        self.data_dir = data_dir
+        self.metadata: Dict[str, Table] = {}
+        self.dirty: Set[str] = set()
+        # Каталог не удалось записать: он сохраняется при следующем commit
+        self.catalog_dirty = False
+        self.lock = StorageLock(metadata_file)
+        # Версия базы, которой соответствует каталог в памяти
+        self.version: Optional[int] = None
+        # Вложенность acquire/release
+        self._depth = 0
+        # True - flush после команд ничего не пишет, изменения копятся
+        # до commit (пакетный режим)
+        self.deferred = False
+        # Открытая транзакция: каталог и состояния таблиц на момент begin
+        self.transaction: Optional[Dict[str, Any]] = None
+        # flush_delay > 0: запись уходит в фоновый поток
+        self.writer: Optional[BackgroundWriter] = None
+        if flush_delay > 0:
+            self.writer = BackgroundWriter(
+                metadata_file, data_dir, flush_delay,
+                self._written, self.lock.release,
+            )
+        # Старый формат каталога мигрирует при загрузке - нужна запись
+        self.acquire(exclusive=True)
+        self.release()
+
+    def acquire(self, exclusive: bool = False) -> Dict[str, Table]:
+        """Берёт блокировку базы на время команды и возвращает каталог.
+
+        Если база на диске новее каталога в памяти, он перечитывается.
+        Пока фоновый поток не записал изменения этого процесса, его
+        exclusive-блокировка не отпускается, и команда идёт под ней.
+        """
+        if self._hold(exclusive):
+            return self.metadata
+        return self.refresh()
+
+    def _hold(self, exclusive: bool) -> bool:
+        """Берёт блокировку; True - её уже держит фоновая запись."""
+        self._depth += 1
+        if self._depth > 1:
+            return True
+        if self.writer is None:
+            self.lock.acquire(exclusive)
+            return False
+        with self.writer.condition:
+            # Пока команда идёт, поток не снимет блокировку
+            self.writer.holds += 1
+            if self.lock.held:
+                return True
+            self.lock.acquire(exclusive)
+            return False
+
+    def release(self) -> None:
+        """Снимает блокировку после команды.
+
+        Недописанные фоновой записью изменения держат её дальше: поток
+        снимет блокировку сам, когда очередь опустеет.
+        """
+        if self._depth == 0:
+            return
+        self._depth -= 1
+        if self._depth > 0:
+            return
+        if self.writer is None:
+            self.lock.release()
+            return
+        with self.writer.condition:
+            self.writer.holds -= 1
+            if not self.writer.pending_locked():
+                self.lock.release()
+
+    def load(self) -> Dict[str, Table]:
+        """Перечитывает каталог с диска, строки таблиц грузятся лениво."""
+        catalog = load_metadata(self.metadata_file)
+        self.metadata = {}
+        self.dirty.clear()
+        self.catalog_dirty = False
+
+        for table_name, entry in catalog.items():
+            if 'data' in entry:
+                # Старый формат: строки лежат прямо в db_meta.json.
+                # Переносим их в сегмент при ближайшем сохранении.
+                table = Table.from_catalog(table_name, entry)
+                table.rows = entry['data']
+                self.dirty.add(table_name)
+            else:
+                loader = partial(
+                    self._load_segment, table_name, entry['columns']
+                )
+                table = Table.from_catalog(table_name, entry, loader)
+            self.metadata[table_name] = table
+
+        # Процессы пула стартуют, пока таблицы читаются и идут запросы
+        parallel.warm_up(
+            max((table.row_count for table in self.metadata.values()), default=0)
+        )
+        if self.dirty:
+            print("Обнаружен старый формат db_meta.json, выполняется миграция.")
+            self.commit()
+        return self.metadata
+
+    def _load_segment(
+        self, table_name: str, columns: List[Tuple[str, str]]
+    ) -> Tuple[Union[ColumnStore, List], List, Optional[int]]:
+        """Читает сегмент таблицы, её журнал и счётчик ID из сегмента."""
+        segment, sequence = load_table_data(table_name, self.data_dir, columns)
+        return segment, load_wal(table_name, self.data_dir), sequence
+
+    def refresh(self) -> Dict[str, Table]:
+        """Перечитывает каталог, если базу изменил другой процесс.
+
+        Вызывается под блокировкой.
+        """
+        version = self.lock.version()
+        if version != self.version:
+            self.version = version
+            self.load()
+        return self.metadata
+
+    def snapshot(self, table_names: Iterable[str]) -> Dict[str, Table]:
+        """Каталог для чтения: названные таблицы заменены снимками.
+
+        Вызывается под блокировкой, строки таблиц загружаются сразу;
+        читать каталог можно уже без неё. После чтения его закрывают
+        close_snapshot.
+        """
+        catalog = dict(self.metadata)
+        for table_name in table_names:
+            if table_name in catalog:
+                catalog[table_name] = TableSnapshot(catalog[table_name])
+        return catalog
+
+    def _written(self) -> None:
+        """Фоновый поток записал пачку под нашей блокировкой."""
+        self.version = self.lock.bump()
+
+    def mark_dirty(self, table_name: str) -> None:
+        """Помечает таблицу как изменённую."""
+        self.dirty.add(table_name)
+
+    def flush(self) -> None:
+        """Сохраняет изменения команды; в режиме deferred они ждут commit."""
+        if not self.deferred:
+            self.commit()
+
+    def begin(self) -> None:
+        """Начинает транзакцию.
+
+        До commit изменения не пишутся на диск, а exclusive-блокировка
+        базы не снимается. Таблицы не копируются: каждая продолжает
+        работу с fork() своего хранилища (см. Table.savepoint).
+        """
+        if self.transaction is not None:
+            raise ValueError("Транзакция уже начата.")
+        self.commit()
+        self.acquire(exclusive=True)
+        self.transaction = {
+            'tables': dict(self.metadata),
+            'states': {
+                name: table.savepoint()
+                for name, table in self.metadata.items()
+            },
+            'deferred': self.deferred,
+        }
+        self.deferred = True
+
+    def rollback(self) -> None:
+        """Отменяет изменения транзакции в памяти; на диск они не попали."""
+        if self.transaction is None:
+            raise ValueError("Нет открытой транзакции.")
+        transaction, self.transaction = self.transaction, None
+        for name, state in transaction['states'].items():
+            transaction['tables'][name].rollback(state)
+        self.metadata.clear()
+        self.metadata.update(transaction['tables'])
+        self.dirty.clear()
+        self.deferred = transaction['deferred']
+        self.release()
+
+    def commit(self) -> None:
+        """Дописывает журналы изменённых таблиц и сохраняет каталог.
+
+        Открытая транзакция завершается: все её изменения сохраняются
+        одной записью. Сегмент переписывается целиком только на
+        контрольной точке. С фоновым потоком задания только ставятся в
+        очередь. Вызывается под exclusive-блокировкой (без неё берёт её
+        сам, не перечитывая каталог).
+
+        Ошибка записи - своя или ещё не сообщённая фоновым потоком -
+        поднимается как ValueError; незаписанные изменения остаются в
+        сессии и пишутся следующим commit.
+        """
+        transaction, self.transaction = self.transaction, None
+        if transaction is not None:
+            for table in transaction['tables'].values():
+                table.drop_savepoint()
+            self.deferred = transaction['deferred']
+            try:
+                self.commit()
+            finally:
+                self.release()
+            return
+        if self.writer is not None:
+            self._writer_failure(self.writer)
+        if not self.dirty and not self.catalog_dirty:
+            return
+        if self._depth == 0:
+            self._hold(exclusive=True)
+            try:
+                self.commit()
+            finally:
+                self.release()
+            return
+
+        tasks: List[Task] = []
+        for table_name in sorted(self.dirty):
+            table = self.metadata.get(table_name)
+            if table is None:
+                tasks.append(('remove', table_name))
+            elif table.loaded:
+                tasks.extend(self._table_tasks(table))
+
+        catalog = {
+            table_name: table.to_catalog()
+            for table_name, table in self.metadata.items()
+        }
+        self.dirty.clear()
+        self.catalog_dirty = False
+        if self.writer is not None:
+            tasks.append(('metadata', copy.deepcopy(catalog)))
+            self.writer.submit(tasks)
+            return
+        tasks.append(('metadata', catalog))
+        try:
+            write_tasks(tasks, self.metadata_file, self.data_dir)
+        except OSError as e:
+            self._restore(tasks)
+            raise ValueError(ERROR_WRITE_FAILED.format(e))
+        finally:
+            # Часть файлов могла измениться и до ошибки
+            self.version = self.lock.bump()
+
+    def _table_tasks(self, table: Table) -> List[Task]:
+        """Журнал или контрольная точка для одной таблицы."""
+        tasks: List[Task] = []
+        if table.needs_checkpoint():
+            store = table.store
+            if table.reordered:
+                # В сегменте строки по порядку ID, как при чтении таблицы
+                store = table.ordered_store()
+            elif self.writer is not None:
+                # Поток пишет копию, пока таблица меняется дальше
+                store = store.snapshot()
+            tasks.append(('checkpoint', table.name, store, table.sequence))
+            table.wal_ops = 0
+            table.rewrite = False
+        elif table.pending:
+            tasks.append(('wal', table.name, table.pending))
+            table.wal_ops += table.pending_size
+        table.pending = []
+        return tasks
+
+    def _restore(self, tasks: List[Task]) -> None:
+        """Возвращает в сессию изменения, которые не удалось записать.
+
+        Операции невыполненных записей журнала возвращаются в pending,
+        таблица с незаписанным сегментом переписывается целиком, а
+        каталог сохраняется заново при следующем commit.
+        """
+        for task in coalesce(tasks):
+            if task[0] == 'metadata':
+                self.catalog_dirty = True
+                continue
+            self.dirty.add(task[1])
+            table = self.metadata.get(task[1])
+            if table is None:
+                continue
+            if task[0] == 'wal':
+                table.pending[:0] = task[2]
+                table.wal_ops -= sum(map(operation_size, task[2]))
+            elif task[0] == 'checkpoint':
+                table.rewrite = True
+
+    def _writer_failure(self, writer: BackgroundWriter) -> None:
+        """Сообщает ошибку фоновой записи, вернув её задания в сессию."""
+        failure = writer.take_failure()
+        if failure is not None:
+            error, tasks = failure
+            self._restore(tasks)
+            raise ValueError(ERROR_WRITE_FAILED.format(error))
+
+    def close(self) -> None:
+        """Сохраняет изменения и дожидается их записи на диск.
+
+        Незавершённая транзакция откатывается. Ошибка записи
+        поднимается как ValueError, изменения остаются в сессии, и
+        дальше она пишет их без фонового потока.
+        """
+        if self.transaction is not None:
+            self.rollback()
+            print("Незавершённая транзакция отменена.")
+        writer = self.writer
+        try:
+            self.commit()
+        finally:
+            if writer is not None:
+                writer.close()
+                self.writer = None
+                if self._depth == 0:
+                    # Поток, остановленный ошибкой, блокировку не снял
+                    self.lock.release()
+        if writer is not None:
+            self._writer_failure(writer)
+
+
+def close_snapshot(catalog: Dict[str, Table]) -> None:
+    """Закрывает снимки каталога, полученного из Database.snapshot."""
+    for table in catalog.values():
+        if isinstance(table, TableSnapshot):
+            table.close()
@@ -0,0 +1,744 @@
+#!/usr/bin/env python3
+"""
+Таблица: схема из каталога и строки из файла-сегмента.
+"""
+import threading
+from itertools import count
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from src.primitive_db.columnar import ColumnStore
+from src.primitive_db.constants import (
+    AUTO_ID_COLUMN,
+    COMPACT_MIN_DEAD,
+    WAL_CHECKPOINT_MIN_OPS,
+)
+from src.primitive_db.index import make_index
+
+# Загрузчик сегмента возвращает строки, ещё не применённый журнал и
+# последний выданный ID из сегмента (None - сегмент его не хранит)
+SegmentLoader = Callable[[], Tuple[List[Dict], List[Dict], Optional[int]]]
+
+# Общий источник версий: пересозданная или перечитанная таблица
+# никогда не получит версию, под которой закэширован старый результат.
+# Версия изменения - и штамп born/died его версий строк.
+_versions = count(1)
+_snapshots = count(1)
+
+ID = AUTO_ID_COLUMN[0]
+
+
+def operation_size(operation: Dict) -> int:
+    """Вес операции журнала: пакетная вставка считается по строкам."""
+    if operation['op'] == 'insert_many':
+        return len(operation['rows'])
+    return 1
+
+
+class Table:
+    """Схема и статистика таблицы; строки загружаются при первом обращении.
+
+    Строки хранятся по столбцам в ColumnStore: позиция строки не
+    меняется, пока таблица не уплотнена, а удалённая строка только
+    помечается. На позиции ссылаются первичный ключ (ID -> позиция) и
+    вторичные индексы.
+
+    Все изменения строк идут через insert/update/delete/clear: они
+    записываются в pending и затем дописываются в журнал таблицы.
+
+    Пока таблицу читают снимки (readers), изменения не трогают видимые
+    им версии: update дописывает новую версию строки, delete только
+    ставит штамп died, а записи индексов и первичного ключа об этих
+    версиях остаются (stale) до уплотнения.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        columns: List[Tuple[str, str]],
+        stats: Optional[Dict[str, Any]] = None,
+        loader: Optional[SegmentLoader] = None,
+        sequence: Optional[int] = None,
+        indexes: Optional[Dict[str, str]] = None,
+    ) -> None:
+        self.name = name
+        self.columns = [tuple(column) for column in columns]
+        # Последний выданный ID; None - неизвестен до загрузки строк
+        self.sequence = sequence
+        self.stats = dict(stats or {})
+        # Столбец -> вид индекса; сами индексы строятся при первом обращении
+        self.index_kinds: Dict[str, str] = dict(indexes or {})
+        self.indexes: Dict[str, Any] = {}
+        # ID -> позиция; строится при первом обращении
+        self._primary: Optional[Dict[int, int]] = None
+        self.dead = 0
+        self._loader = loader
+        self._store: Optional[ColumnStore] = None
+        # Сервер читает таблицы из нескольких потоков: загрузка - одна
+        self._load_lock = threading.Lock()
+        # Индексы и ключ меняются и читаются снимками под latch
+        self.latch = threading.Lock()
+        # Открытые снимки таблицы
+        self.readers: Set[int] = set()
+        # Сколько удалённых версий ещё есть в индексах и ключе
+        self.stale = 0
+        # Новые версии update дописаны в конец: порядок позиций уже не
+        # порядок ID, и сканы сортируют позиции по ID до уплотнения
+        self.reordered = False
+        if loader is None:
+            self._attach([])
+        self.pending: List[Dict] = []
+        self.version = next(_versions)
+        self.wal_ops = 0
+        # Новая таблица сразу получает собственный сегмент
+        self.rewrite = loader is None
+
+    @classmethod
+    def from_catalog(
+        cls,
+        name: str,
+        entry: Dict[str, Any],
+        loader: Optional[SegmentLoader] = None,
+    ) -> "Table":
+        """Создает таблицу из записи каталога."""
+        return cls(
+            name,
+            entry['columns'],
+            entry.get('stats'),
+            loader,
+            entry.get('sequence'),
+            entry.get('indexes'),
+        )
+
+    @property
+    def loaded(self) -> bool:
+        """Загружены ли строки в память."""
+        return self._store is not None
+
+    @property
+    def store(self) -> ColumnStore:
+        """Колоночное хранилище, при необходимости читается из сегмента."""
+        if self._store is None:
+            with self._load_lock:
+                if self._store is None:
+                    self._load()
+        return self._store
+
+    def _load(self) -> None:
+        segment, operations, sequence = (
+            self._loader() if self._loader else ([], [], 0)
+        )
+        self._loader = None
+        if sequence is None:
+            # json или сегмент старого формата: счётчик - по строкам
+            if isinstance(segment, ColumnStore):
+                sequence = max(segment.columns[ID].data, default=0)
+            else:
+                sequence = max((row[ID] for row in segment), default=0)
+        # Каталог пишется после сегмента и после сбоя между ними может
+        # отстать: берётся больший из счётчиков
+        self.sequence = max(self.sequence or 0, sequence)
+        if isinstance(segment, ColumnStore) and not operations:
+            # Столбцы остаются представлениями над файлом сегмента
+            self._attach_store(segment)
+        else:
+            if isinstance(segment, ColumnStore):
+                segment = segment.rows()
+            self._attach(self._replay(segment, operations))
+        self.wal_ops = sum(map(operation_size, operations))
+
+    @property
+    def rows(self) -> List[Dict]:
+        """Живые строки таблицы в порядке ID (он же порядок вставки)."""
+        if self.reordered:
+            return self.store.rows(self.in_order(list(self.store.positions())))
+        return self.store.rows()
+
+    @rows.setter
+    def rows(self, rows: List[Dict]) -> None:
+        self._loader = None
+        top_id = max((row[ID] for row in rows), default=0)
+        self.sequence = max(self.sequence or 0, top_id)
+        self._attach(rows)
+        self.rewrite = True
+        self.version = next(_versions)
+
+    @property
+    def row_count(self) -> int:
+        """Количество строк без загрузки сегмента."""
+        if self._store is not None:
+            return len(self._store) - self.dead
+        return self.stats.get('rows', 0)
+
+    def positions(self) -> Iterator[int]:
+        """Позиции всех живых строк в порядке ID."""
+        if self.reordered:
+            return iter(self.in_order(list(self.store.positions())))
+        return self.store.positions()
+
+    def in_order(self, positions: List[int]) -> List[int]:
+        """Позиции в порядке ID строк, как без версий и после перезагрузки."""
+        if not self.reordered:
+            return positions
+        return sorted(positions, key=self.store.columns[ID].getter())
+
+    def row(self, position: int) -> Dict:
+        """Строка-словарь на позиции."""
+        return self.store.row(position)
+
+    def row_reader(
+        self, columns: Optional[List[str]] = None
+    ) -> Callable[[int], Dict]:
+        """Функция позиция -> строка только из columns (по умолчанию - все)."""
+        store = self.store
+        getters = [
+            (name, store.columns[name].getter())
+            for name in columns or store.names
+        ]
+        return lambda position: {name: get(position) for name, get in getters}
+
+    def _attach(self, rows: List[Dict]) -> None:
+        """Делает rows текущими строками и строит ключ, счётчик и индексы."""
+        self._attach_store(ColumnStore.from_rows(self.columns, rows))
+
+    def _attach_store(self, store: ColumnStore) -> None:
+        """Делает store текущим хранилищем (все строки живые)."""
+        self._store = store
+        self.dead = 0
+        self.reordered = False
+        if self.sequence is None:
+            # Таблица без сегмента и счётчика: он - по её строкам
+            self.sequence = max(store.columns[ID].data, default=0)
+        self._reset_indexes()
+
+    @property
+    def primary(self) -> Dict[int, int]:
+        """Первичный ключ ID -> позиция."""
+        if self._primary is None:
+            store = self.store
+            alive = store.alive
+            self._primary = {
+                row_id: position
+                for position, row_id in enumerate(store.column_values(ID))
+                if alive[position]
+            }
+        return self._primary
+
+    def _reset_indexes(self) -> None:
+        """Сбрасывает первичный ключ и индексы: хранилище сменилось.
+
+        Они строятся заново при первом обращении (_index, primary).
+        """
+        self._primary = None
+        self.indexes = {}
+        self.stale = 0
+
+    def _index(self, column: str) -> Optional[Any]:
+        """Индекс по столбцу; объявленный, но ещё не построенный строится."""
+        index = self.indexes.get(column)
+        if index is None and column in self.index_kinds:
+            store = self.store
+            index = make_index(column, self.index_kinds[column])
+            index.build(store.column_values(column), store.alive)
+            self.indexes[column] = index
+        return index
+
+    def _compact(self) -> None:
+        """Убирает удалённые версии; позиции строк при этом меняются.
+
+        Это и сборка мусора: снимки продолжают читать старое хранилище,
+        и оно освобождается, когда закроется последний из них.
+        """
+        self._store = self.ordered_store()
+        self.dead = 0
+        self.reordered = False
+        self._reset_indexes()
+
+    def ordered_store(self) -> ColumnStore:
+        """Живые строки новым хранилищем в порядке ID."""
+        store = self.store
+        if not self.reordered:
+            return store.compact()
+        return store.compact(self.in_order(list(store.positions())))
+
+    def create_index(self, column: str, kind: str) -> None:
+        """Создает индекс по столбцу."""
+        self.store
+        self.index_kinds[column] = kind
+        self._index(column)
+
+    def drop_index(self, column: str) -> None:
+        """Удаляет индекс по столбцу."""
+        del self.index_kinds[column]
+        self.indexes.pop(column, None)
+
+    def positions_by_id(self, ids: Iterable[int]) -> List[int]:
+        """Позиции строк с указанными ID по первичному ключу."""
+        self.store
+        primary = self.primary
+        return self._visible(sorted({primary[i] for i in ids if i in primary}))
+
+    def _visible(self, positions: List[int]) -> List[int]:
+        """Отбрасывает позиции удалённых версий из индексов и ключа."""
+        if not self.stale:
+            return positions
+        alive = self._store.alive
+        return [position for position in positions if alive[position]]
+
+    def _index_for(self, column: str, operator: str) -> Optional[Any]:
+        """Вторичный индекс, умеющий operator по column."""
+        self.store
+        index = self._index(column)
+        if index is None or operator not in index.operators:
+            return None
+        return index
+
+    def estimate(
+        self, column: str, operator: str, value: Any
+    ) -> Optional[int]:
+        """Сколько строк вернёт lookup, или None без подходящего индекса."""
+        if column == ID and operator == "==":
+            return 1
+        if column == ID and operator == "in":
+            return len(value)
+        index = self._index_for(column, operator)
+        if index is None:
+            return None
+        return index.estimate(operator, value)
+
+    def lookup(
+        self, column: str, operator: str, value: Any
+    ) -> Optional[List[int]]:
+        """Позиции строк по индексу или None, если индекс не подходит."""
+        if column == ID and operator == "==":
+            return self.positions_by_id([value])
+        if column == ID and operator == "in":
+            return self.positions_by_id(value)
+        index = self._index_for(column, operator)
+        if index is None:
+            return None
+        return self._visible(sorted(index.lookup(operator, value)))
+
+    def column_range(self, column: str) -> Optional[Tuple[Any, Any]]:
+        """Минимум и максимум столбца по индексу, без просмотра строк.
+
+        (None, None) для пустой таблицы, None - если индекса нет.
+        """
+        self.store
+        if self.stale:
+            # В ключах есть значения удалённых версий
+            return None
+        if column == ID:
+            keys = self.primary
+        elif column in self.index_kinds:
+            index = self._index(column)
+            keys = index.keys if index.kind == "sorted" else index.entries
+        else:
+            return None
+        if not keys:
+            return None, None
+        if isinstance(keys, list):
+            return keys[0], keys[-1]
+        return min(keys), max(keys)
+
+    def column_types(self) -> Dict[str, str]:
+        """Словарь имя столбца -> тип."""
+        return {name: col_type for name, col_type in self.columns}
+
+    def next_id(self) -> int:
+        """Выдает следующий ID; удалённые ID повторно не выдаются."""
+        self.store
+        self.sequence += 1
+        return self.sequence
+
+    def allocate_ids(self, count: int) -> range:
+        """Выдает сразу count подряд идущих ID."""
+        self.store
+        start = self.sequence + 1
+        self.sequence += count
+        return range(start, self.sequence + 1)
+
+    def insert(self, record: Dict) -> None:
+        """Добавляет строку."""
+        store = self.store
+        stamp = next(_versions)
+        with self.latch:
+            if self.readers:
+                store.track_versions()
+            position = store.append(record, stamp)
+            for column, index in self.indexes.items():
+                index.add(record[column], position)
+            self._link(record[ID], position)
+            self.pending.append({'op': 'insert', 'row': record})
+            self.version = stamp
+
+    def _link(self, row_id: int, position: int) -> None:
+        """Ставит в ключ новую версию строки row_id.
+
+        Прежняя позиция ID (удалённая версия, которую ещё видят
+        снимки) становится предыдущей версией.
+        """
+        primary = self.primary
+        previous = primary.get(row_id)
+        if previous is not None:
+            self._store.prior[position] = previous
+        primary[row_id] = position
+
+    def insert_many(self, records: List[Dict]) -> None:
+        """Добавляет пакет строк одной операцией журнала.
+
+        Хранилище проверяет весь пакет до записи, так что ошибка
+        значения не оставляет пакет добавленным наполовину.
+        """
+        if not records:
+            return
+        store = self.store
+        stamp = next(_versions)
+        with self.latch:
+            if self.readers:
+                store.track_versions()
+            positions = store.extend(records, stamp)
+            for column, index in self.indexes.items():
+                index.add_many(
+                    [record[column] for record in records], positions
+                )
+            ids = [record[ID] for record in records]
+            if self.stale:
+                for row_id, position in zip(ids, positions):
+                    self._link(row_id, position)
+            else:
+                self.primary.update(zip(ids, positions))
+            self.pending.append({'op': 'insert_many', 'rows': records})
+            self.version = stamp
+
+    def update(self, positions: Iterable[int], changes: Dict) -> int:
+        """Применяет changes к строкам на указанных позициях.
+
+        ID - первичный ключ и в changes не входит. Без снимков строки
+        меняются на месте, иначе каждая получает новую версию в конце
+        хранилища.
+        """
+        store = self.store
+        stamp = next(_versions)
+        with self.latch:
+            if self.readers:
+                store.track_versions()
+                ids = self._update_versions(positions, changes, stamp)
+            else:
+                ids = self._update_in_place(positions, changes)
+            if not ids:
+                return 0
+            self.pending.append({'op': 'update', 'ids': ids, 'set': changes})
+            self.version = stamp
+            if self.readers:
+                self._collect(store)
+        return len(ids)
+
+    def _update_in_place(
+        self, positions: Iterable[int], changes: Dict
+    ) -> List[int]:
+        store = self._store
+        indexes = [
+            index for column, index in self.indexes.items()
+            if column in changes
+        ]
+        ids = []
+        for position in positions:
+            for index in indexes:
+                index.remove(store.get(position, index.column), position)
+                index.add(changes[index.column], position)
+            ids.append(store.get(position, ID))
+            for column, value in changes.items():
+                store.set(position, column, value)
+        return ids
+
+    def _update_versions(
+        self, positions: Iterable[int], changes: Dict, stamp: int
+    ) -> List[int]:
+        store = self._store
+        ids = []
+        for position in positions:
+            record = store.row(position)
+            ids.append(record[ID])
+            record.update(changes)
+            new_position = store.append(record, stamp)
+            store.kill(position, stamp)
+            for column, index in self.indexes.items():
+                index.add(record[column], new_position)
+            store.prior[new_position] = position
+            self.primary[record[ID]] = new_position
+        self.dead += len(ids)
+        self.stale += len(ids)
+        if ids:
+            self.reordered = True
+        return ids
+
+    def _collect(self, store: ColumnStore) -> None:
+        """Уплотняет, когда удалённых версий больше, чем живых строк."""
+        if self.dead > max(COMPACT_MIN_DEAD, len(store) - self.dead):
+            self._compact()
+
+    def delete(self, positions: Iterable[int]) -> int:
+        """Удаляет строки на указанных позициях, помечая их в alive.
+
+        Когда удалённых позиций больше, чем живых строк, таблица
+        уплотняется.
+        """
+        store = self.store
+        stamp = next(_versions)
+        keep = bool(self.readers)
+        ids = []
+        with self.latch:
+            if keep:
+                store.track_versions()
+            for position in positions:
+                if not store.is_alive(position):
+                    continue
+                row_id = store.get(position, ID)
+                if not keep:
+                    for column, index in self.indexes.items():
+                        index.remove(store.get(position, column), position)
+                    del self.primary[row_id]
+                store.kill(position, stamp)
+                ids.append(row_id)
+            if not ids:
+                return 0
+            self.dead += len(ids)
+            if keep:
+                self.stale += len(ids)
+            self._collect(store)
+            self.pending.append({'op': 'delete', 'ids': ids})
+            self.version = stamp
+        return len(ids)
+
+    def clear(self) -> None:
+        """Удаляет все строки."""
+        self._loader = None
+        self._attach([])
+        self.pending.append({'op': 'clear'})
+        self.version = next(_versions)
+
+    def savepoint(self) -> Dict[str, Any]:
+        """Состояние таблицы для отката транзакции.
+
+        Строки не копируются: таблица продолжает работу с fork()
+        хранилища. Сохранённое хранилище делит с ним буферы, и rollback
+        отрезает от них строки, дописанные после mark().
+        """
+        state = {
+            'store': self._store,
+            'loader': self._loader,
+            'dead': self.dead,
+            'reordered': self.reordered,
+            'sequence': self.sequence,
+            'pending': list(self.pending),
+            'wal_ops': self.wal_ops,
+            'rewrite': self.rewrite,
+            'index_kinds': dict(self.index_kinds),
+            'stats': dict(self.stats),
+            'mark': None,
+        }
+        if self._store is not None:
+            state['mark'] = self._store.mark()
+            self._store = self._store.fork()
+        return state
+
+    def rollback(self, state: Dict[str, Any]) -> None:
+        """Возвращает таблицу к состоянию savepoint.
+
+        Индексы менялись вместе со строками - они строятся заново.
+        """
+        self._store = state['store']
+        if self._store is not None:
+            self._store.truncate(state['mark'])
+        self._loader = state['loader']
+        self.dead = state['dead']
+        self.reordered = state['reordered']
+        self.sequence = state['sequence']
+        self.pending = state['pending']
+        self.wal_ops = state['wal_ops']
+        self.rewrite = state['rewrite']
+        self.index_kinds = state['index_kinds']
+        self.stats = state['stats']
+        self._reset_indexes()
+        self.version = next(_versions)
+
+    def drop_savepoint(self) -> None:
+        """Транзакция зафиксирована: копировать столбцы больше не нужно."""
+        if self._store is not None:
+            self._store.shared.clear()
+
+    def _replay(
+        self, rows: List[Dict], operations: List[Dict]
+    ) -> List[Dict]:
+        """Применяет журнал к строкам сегмента.
+
+        Операции адресуют строки по ID, поэтому повторное применение
+        журнала к уже сохранённому сегменту даёт тот же результат.
+        """
+        if not operations:
+            return rows
+
+        positions = {row[ID]: i for i, row in enumerate(rows)}
+        for operation in operations:
+            op = operation['op']
+            if op in ('insert', 'insert_many'):
+                added = operation['rows'] if op == 'insert_many' else [
+                    operation['row']
+                ]
+                for row in added:
+                    if row[ID] in positions:
+                        rows[positions[row[ID]]] = row
+                    else:
+                        positions[row[ID]] = len(rows)
+                        rows.append(row)
+                    # ID мог быть удалён позже в журнале: счётчик всё
+                    # равно должен пройти мимо него
+                    self.sequence = max(self.sequence, row[ID])
+            elif op == 'update':
+                for row_id in operation['ids']:
+                    if row_id in positions:
+                        rows[positions[row_id]].update(operation['set'])
+            elif op == 'delete':
+                for row_id in operation['ids']:
+                    if row_id in positions:
+                        rows[positions.pop(row_id)] = None
+            elif op == 'clear':
+                rows = []
+                positions = {}
+        return [row for row in rows if row is not None]
+
+    @property
+    def pending_size(self) -> int:
+        """Вес ещё не записанных в журнал операций."""
+        return sum(map(operation_size, self.pending))
+
+    def needs_checkpoint(self) -> bool:
+        """Пора ли переписать сегмент целиком и очистить журнал."""
+        if self.rewrite:
+            return True
+        total_ops = self.wal_ops + self.pending_size
+        return total_ops > max(WAL_CHECKPOINT_MIN_OPS, self.row_count)
+
+    def to_catalog(self) -> Dict[str, Any]:
+        """Запись для db_meta.json: только схема и статистика."""
+        self.stats['rows'] = self.row_count
+        entry = {'columns': [list(column) for column in self.columns]}
+        if self.sequence is not None:
+            entry['sequence'] = self.sequence
+        if self.index_kinds:
+            entry['indexes'] = self.index_kinds
+        entry['stats'] = self.stats
+        return entry
+
+
+class TableSnapshot(Table):
+    """Таблица в версии на момент снимка, только для чтения.
+
+    Снимок берётся, пока изменений нет (под блокировкой базы), и дальше
+    читается без неё: видимые строки собирает ColumnStore.view() по
+    штампам версий, а индексы и ключ - общие с таблицей и читаются под
+    её latch, с отбором видимых позиций. Пока снимок открыт, таблица не
+    убирает из индексов записи удалённых версий; close() его закрывает.
+    """
+
+    def __init__(self, table: Table) -> None:
+        base = table.store
+        with table.latch:
+            # Индексы общие со снимком: строятся сейчас, по его версии
+            for column in table.index_kinds:
+                table._index(column)
+            self.table = table
+            self.name = table.name
+            self.columns = table.columns
+            self.stats = dict(table.stats)
+            self.index_kinds = dict(table.index_kinds)
+            self.indexes = dict(table.indexes)
+            self.version = table.version
+            self.stale = table.stale
+            self.dead = table.dead
+            # Версии, дописанные после снимка, ему не видны
+            self.reordered = table.reordered
+            self.base = base
+            self._primary = table.primary
+            self._store = None
+            self._row_count = table.row_count
+            self.token = next(_snapshots)
+            table.readers.add(self.token)
+
+    def close(self) -> None:
+        """Закрывает снимок: таблица снова может менять строки на месте."""
+        self.table.readers.discard(self.token)
+
+    @property
+    def store(self) -> ColumnStore:
+        """Версии строк, видимые снимку."""
+        if self._store is None:
+            with self.table.latch:
+                self._store = self.base.view(self.version)
+        return self._store
+
+    @property
+    def row_count(self) -> int:
+        return self._row_count
+
+    def positions_by_id(self, ids: Iterable[int]) -> List[int]:
+        """Позиции видимых версий строк с указанными ID.
+
+        Ключ общий с таблицей и указывает на последнюю версию строки;
+        версии новее снимка пропускаются по цепочке prior.
+        """
+        alive = self.store.alive
+        limit = len(alive)
+        prior = self.base.prior
+        found = set()
+        with self.table.latch:
+            for row_id in ids:
+                position = self._primary.get(row_id)
+                while position is not None and position >= limit:
+                    position = prior.get(position)
+                if position is not None and alive[position]:
+                    found.add(position)
+        return sorted(found)
+
+    def _visible(self, positions: List[int]) -> List[int]:
+        alive = self.store.alive
+        limit = len(alive)
+        return [
+            position for position in positions
+            if position < limit and alive[position]
+        ]
+
+    def estimate(
+        self, column: str, operator: str, value: Any
+    ) -> Optional[int]:
+        self.store
+        with self.table.latch:
+            return super().estimate(column, operator, value)
+
+    def lookup(
+        self, column: str, operator: str, value: Any
+    ) -> Optional[List[int]]:
+        if column == ID:
+            # positions_by_id берёт latch сам
+            return super().lookup(column, operator, value)
+        self.store
+        with self.table.latch:
+            return super().lookup(column, operator, value)
+
+    def column_range(self, column: str) -> Optional[Tuple[Any, Any]]:
+        """Как у таблицы, пока она не менялась после снимка."""
+        self.store
+        with self.table.latch:
+            if self.table.version != self.version:
+                return None
+            return super().column_range(column)
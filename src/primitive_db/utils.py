@@ -1,7 +1,105 @@
 #!/usr/bin/env python3
+import csv
+import io
 import json
 import os
-from typing import Any, Dict, List, Optional, Tuple
+import sys
+from itertools import islice
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    TextIO,
+    Tuple,
+    Union,
+)
+
+from src.primitive_db.columnar import ColumnStore
+from src.primitive_db.constants import (
+    MAX_CELL_WIDTH,
+    PAGE_SIZE,
+    RENDER_SAMPLE_ROWS,
+    SEGMENT_EXTENSION,
+    TABLE_FILE_EXTENSIONS,
+)
+from src.primitive_db.segment import read_segment, write_segment
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Форматы файлов для copy: расширение -> формат
+COPY_FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+
+# Буфер записи при выгрузке
+WRITE_BUFFER_SIZE = 1 << 20
+
+# Файл блокировки базы: <файл каталога>.lock
+LOCK_SUFFIX = ".lock"
+
+
+class StorageLock:
+    """Блокировка базы между процессами: flock на файле блокировки.
+
+    shared - для чтения, exclusive - для записи. В том же файле хранится
+    версия базы - счётчик, который увеличивает каждый писатель; по нему
+    процесс понимает, что его каталог устарел. Без fcntl (Windows)
+    процессы не блокируют друг друга, но версия ведётся.
+    """
+
+    def __init__(self, metadata_file: str) -> None:
+        self.path = metadata_file + LOCK_SUFFIX
+        self.descriptor: Optional[int] = None
+        self.exclusive = False
+
+    @property
+    def held(self) -> bool:
+        return self.descriptor is not None
+
+    def acquire(self, exclusive: bool = False) -> None:
+        """Ждёт блокировку: shared или exclusive."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        descriptor = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            try:
+                fcntl.flock(
+                    descriptor, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+                )
+            except BaseException:
+                os.close(descriptor)
+                raise
+        self.descriptor = descriptor
+        self.exclusive = exclusive
+
+    def release(self) -> None:
+        """Снимает блокировку (закрытие файла снимает flock)."""
+        if self.descriptor is not None:
+            os.close(self.descriptor)
+            self.descriptor = None
+            self.exclusive = False
+
+    def version(self) -> int:
+        """Текущая версия базы; блокировка должна быть взята."""
+        os.lseek(self.descriptor, 0, os.SEEK_SET)
+        try:
+            return int(os.read(self.descriptor, 32) or 0)
+        except ValueError:
+            return 0
+
+    def bump(self) -> int:
+        """Увеличивает версию после записи; нужна exclusive-блокировка."""
+        version = self.version() + 1
+        os.ftruncate(self.descriptor, 0)
+        os.lseek(self.descriptor, 0, os.SEEK_SET)
+        os.write(self.descriptor, f"{version}\n".encode())
+        return version
 
 
 def load_metadata(filepath: str = "db_meta.json") -> Dict[str, Any]:
@@ -17,14 +115,55 @@ def load_metadata(filepath: str = "db_meta.json") -> Dict[str, Any]:
         return {}
 
 
-def save_metadata(filepath: str, data: Dict[str, Any]) -> None:
-    """Сохраняем в json"""
+def _fsync_dir(directory: str) -> None:
+    """Сбрасывает на диск запись каталога (переименование файла)"""
+    try:
+        descriptor = os.open(directory or ".", os.O_RDONLY)
+    except OSError:
+        return
     try:
-        with open(filepath, 'w', encoding='utf-8') as file:
-            json.dump(data, file, indent=2, ensure_ascii=False)
+        os.fsync(descriptor)
+    except OSError:
+        pass
+    finally:
+        os.close(descriptor)
+
+
+def _atomic_write(
+    filepath: str, write: Callable[[Any], None], binary: bool = False
+) -> None:
+    """Пишет файл через временный: write(file), fsync, os.replace.
+
+    После сбоя на диске остаётся либо старая, либо новая версия файла,
+    но не обрезанная.
+    """
+    temp_path = f"{filepath}.{os.getpid()}.tmp"
+    try:
+        if binary:
+            file = open(temp_path, 'wb')
+        else:
+            file = open(temp_path, 'w', encoding='utf-8')
+        with file:
+            write(file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, filepath)
+    except BaseException:
+        _remove_file(temp_path)
+        raise
+    _fsync_dir(os.path.dirname(filepath))
+
+
+def save_metadata(
+    filepath: str, data: Dict[str, Any], verbose: bool = True
+) -> None:
+    """Сохраняем в json; ошибка записи (OSError) передаётся вызывающему"""
+    _atomic_write(
+        filepath,
+        lambda file: json.dump(data, file, indent=2, ensure_ascii=False),
+    )
+    if verbose:
         print(f"Metadata saved to {filepath}")
-    except IOError as e:
-        print(f"Error saving metadata: {e}")
 
 
 def validate_column_definition(
@@ -67,9 +206,40 @@ def print_help() -> None:
         "- удалить таблицу"
     )
     print("insert <имя_таблицы> <столбец=значение> и тд - добавить запись")
+    print(
+        "copy <таблица> from <файл.csv|файл.jsonl> - загрузить записи "
+        "из файла (csv с заголовком)"
+    )
+    print(
+        "copy <таблица> [where условие] to <файл> [csv|jsonl] - выгрузить "
+        "записи в файл"
+    )
     print(
         "select <имя_таблицы> [where условие(><==)] - показать записи"
     )
+    print(
+        "select <столбец>, <столбец> from <имя_таблицы> [where условие] "
+        "[limit n [offset m]] - выбранные столбцы и часть записей"
+    )
+    print(
+        "Условия можно объединять: and, or, not, скобки, "
+        "in (1, 2), between 1 and 5, like 'ab%'"
+    )
+    print("Например: select users where age>=18 and name like 'J%'")
+    print(
+        "select count(*), sum|min|max|avg(<столбец>) from <таблица> "
+        "[group by <столбец>] [where условие] - агрегаты"
+    )
+    print("Например: select count(*), avg(age) from users group by sex")
+    print(
+        "select [<таблица.столбец>, ... from] <таблица> join <таблица> "
+        "on <таблица.столбец> == <таблица.столбец> [where условие] "
+        "[limit n [offset m]] - соединение таблиц"
+    )
+    print(
+        "Например: select users.name, orders.total from users join orders "
+        "on users.ID == orders.user_id where orders.total > 100"
+    )
     print(
         "update <таблица> set <столбец=значение> "
         "[where условие] - обновить записи"
@@ -80,48 +250,261 @@ def print_help() -> None:
     )
     print("delete <таблица> [where условие] - удалить записи")
     print("Например: delete users, delete users where age<18")
+    print(
+        "create_index <таблица> <столбец> [hash|sorted] - создать индекс "
+        "(hash для ==, !=, in; sorted ещё и для <, >, between, like)"
+    )
+    print("drop_index <таблица> <столбец> - удалить индекс")
+    print(
+        "begin / commit / rollback - транзакция: изменения сохраняются "
+        "вместе при commit или отменяются"
+    )
     print("exit - выход из программы")
     print("help - справочная информация\n")
 
 
 def save_table_data(
-    table_name: str, data: list, data_dir: str = "data"
+    table_name: str,
+    data: Union[ColumnStore, List[Dict]],
+    data_dir: str = "data",
+    extension: str = SEGMENT_EXTENSION,
+    verbose: bool = True,
+    sequence: int = 0,
 ) -> None:
-    """Сохраняет актуальные данные таблицы в json"""
-    try:
-        # Create data directory if it doesn't exist
-        os.makedirs(data_dir, exist_ok=True)
-        
-        filepath = os.path.join(data_dir, f"{table_name}.json")
-        with open(filepath, 'w', encoding='utf-8') as file:
-            json.dump(data, file, indent=2, ensure_ascii=False)
+    """Сохраняет актуальные данные таблицы; формат - по расширению
+
+    .seg - бинарный сегмент (data должен быть ColumnStore), в его
+    заголовок пишется и sequence - последний выданный ID; .json -
+    список строк. Файл другого формата после сохранения удаляется.
+    Запись атомарная: старый сегмент, возможно открытый через mmap,
+    подменяется новым, а не перезаписывается на месте. Ошибка записи
+    (OSError) передаётся вызывающему.
+    """
+    # Create data directory if it doesn't exist
+    os.makedirs(data_dir, exist_ok=True)
+
+    filepath = os.path.join(data_dir, f"{table_name}{extension}")
+    if extension == SEGMENT_EXTENSION:
+        _atomic_write(
+            filepath,
+            lambda file: write_segment(file, data, sequence),
+            binary=True,
+        )
+    else:
+        if isinstance(data, ColumnStore):
+            data = data.rows()
+        _atomic_write(
+            filepath,
+            lambda file: json.dump(data, file, indent=2, ensure_ascii=False),
+        )
+    for other in TABLE_FILE_EXTENSIONS:
+        if other != extension:
+            _remove_file(os.path.join(data_dir, f"{table_name}{other}"))
+    if verbose:
         print(f"Данные таблицы '{table_name}' сохранены в {filepath}")
-    except IOError as e:
-        print(f"Ошибка сохранения данных: {e}")
 
 
 def load_table_data(
-    table_name: str, data_dir: str = "data"
-) -> list:
-    """Загружает из json данные таблиц"""
+    table_name: str,
+    data_dir: str = "data",
+    columns: Optional[List[Tuple[str, str]]] = None,
+) -> Tuple[Union[ColumnStore, List[Dict]], Optional[int]]:
+    """Загружает данные таблицы: сегмент .seg (через mmap) или json
+
+    Для .seg нужна схема columns; возвращается ColumnStore, для json -
+    список строк. Второе значение - последний выданный ID из заголовка
+    сегмента, None - если файл его не хранит.
+    """
+    filepath = os.path.join(data_dir, f"{table_name}{SEGMENT_EXTENSION}")
+    if columns is not None and os.path.exists(filepath):
+        return read_segment(filepath, columns)
     try:
         filepath = os.path.join(data_dir, f"{table_name}.json")
         if os.path.exists(filepath):
             with open(filepath, 'r', encoding='utf-8') as file:
-                return json.load(file)
-        return []
+                return json.load(file), None
+        return [], None
     except (FileNotFoundError, json.JSONDecodeError):
-        return []
+        return [], None
+
 
+def _remove_file(filepath: str) -> None:
+    try:
+        os.remove(filepath)
+    except FileNotFoundError:
+        pass
+
+
+def remove_table_data(table_name: str, data_dir: str = "data") -> None:
+    """Удаляет файл-сегмент с данными таблицы и его журнал"""
+    for suffix in ("seg", "json", "wal"):
+        _remove_file(os.path.join(data_dir, f"{table_name}.{suffix}"))
+
+
+def append_wal(
+    table_name: str, operations: List[Dict], data_dir: str = "data"
+) -> None:
+    """Дописывает операции в журнал таблицы, по строке на операцию
+
+    Ошибка записи (OSError) передаётся вызывающему, а журнал
+    обрезается до прежней длины: оборванная строка в середине скрыла
+    бы при чтении все записанные после неё.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+
+    filepath = os.path.join(data_dir, f"{table_name}.wal")
+    lines = "".join(
+        json.dumps(op, ensure_ascii=False, separators=(',', ':')) + "\n"
+        for op in operations
+    )
+    descriptor = os.open(filepath, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        start = os.lseek(descriptor, 0, os.SEEK_END)
+        try:
+            data = memoryview(lines.encode('utf-8'))
+            while data:
+                data = data[os.write(descriptor, data):]
+            os.fsync(descriptor)
+        except BaseException:
+            os.ftruncate(descriptor, start)
+            raise
+    finally:
+        os.close(descriptor)
+
+
+def load_wal(table_name: str, data_dir: str = "data") -> List[Dict]:
+    """Читает журнал таблицы; оборванная последняя строка пропускается"""
+    filepath = os.path.join(data_dir, f"{table_name}.wal")
+    operations = []
+    try:
+        with open(filepath, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    operations.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break
+    except FileNotFoundError:
+        pass
+    return operations
+
+
+def clear_wal(table_name: str, data_dir: str = "data") -> None:
+    """Удаляет журнал таблицы после контрольной точки"""
+    try:
+        os.remove(os.path.join(data_dir, f"{table_name}.wal"))
+    except FileNotFoundError:
+        pass
+
+
+def copy_format(filepath: str) -> str:
+    """Формат файла для copy по расширению"""
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension not in COPY_FORMATS:
+        raise ValueError(
+            f'Неизвестный формат файла: "{filepath}". '
+            f'Поддерживаются: {", ".join(COPY_FORMATS)}'
+        )
+    return COPY_FORMATS[extension]
+
+
+def read_rows(filepath: str) -> Iterator[Dict[str, Any]]:
+    """Построчно читает записи из csv (с заголовком) или JSON Lines"""
+    file_format = copy_format(filepath)
+    try:
+        file = open(filepath, 'r', encoding='utf-8', newline='')
+    except OSError as e:
+        raise ValueError(f'Не удалось открыть файл "{filepath}": {e}')
+    with file:
+        if file_format == "csv":
+            reader = csv.reader(file)
+            header = next(reader, [])
+            for row in reader:
+                if not row:
+                    continue
+                if len(row) != len(header):
+                    raise ValueError(
+                        f"Строка {reader.line_num}: ожидалось "
+                        f"{len(header)} значений, получено {len(row)}"
+                    )
+                yield dict(zip(header, row))
+            return
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Строка {number}: некорректный JSON ({e})")
+            if not isinstance(record, dict):
+                raise ValueError(f"Строка {number}: ожидался объект JSON")
+            yield record
 
-def pretty_print_table(records: List[Dict], table_name: str) -> None:
-    """Для вывода таблицы в виде тоблицы"""
+
+def write_rows(
+    filepath: str,
+    columns: List[str],
+    rows: Iterable[Dict[str, Any]],
+    file_format: str,
+) -> int:
+    """Пишет записи в csv или JSON Lines по мере их поступления.
+
+    Строки не накапливаются в памяти: запись идёт через буфер файла.
+    Возвращает число записанных строк.
+    """
+    count = 0
+    try:
+        with open(
+            filepath, 'w', encoding='utf-8', newline='',
+            buffering=WRITE_BUFFER_SIZE,
+        ) as file:
+            if file_format == "csv":
+                writer = csv.writer(file)
+                writer.writerow(columns)
+                for row in rows:
+                    writer.writerow([row[name] for name in columns])
+                    count += 1
+            else:
+                dumps = json.JSONEncoder(
+                    ensure_ascii=False, separators=(',', ':')
+                ).encode
+                write = file.write
+                for row in rows:
+                    write(dumps(row))
+                    write("\n")
+                    count += 1
+    except OSError as e:
+        raise ValueError(f'Не удалось записать файл "{filepath}": {e}')
+    return count
+
+
+def pretty_print_table(
+    records: List[Dict], table_name: str, columns: Optional[List[str]] = None
+) -> None:
+    """Для вывода таблицы в виде тоблицы
+
+    columns задаёт порядок столбцов (обычно - схема таблицы).
+    """
     if not records:
         print(f"Таблица '{table_name}' пуста")
         return
     
-    print(f"\n Данные таблицы '{table_name}':")
-    print("=" * 50)
+    sorted_keys = _column_order(records, columns)
+    # Начало и конец списка: растущие ID шире всего в конце
+    half = RENDER_SAMPLE_ROWS // 2
+    layout = _layout(records[:half] + records[-half:], sorted_keys)
+    out = io.StringIO()
+    out.write(f"\n Данные таблицы '{table_name}':\n{'=' * 50}\n")
+    _render_rows(records, layout, out)
+    out.write(f"Всего записей: {len(records)}\n")
+    sys.stdout.write(out.getvalue())
+
+
+def _column_order(
+    records: List[Dict], columns: Optional[List[str]] = None
+) -> List[str]:
+    """Порядок столбцов: заданный или по алфавиту с ID первым"""
+    if columns:
+        return list(columns)
     
     all_keys = set()
     for record in records:
@@ -131,16 +514,93 @@ def pretty_print_table(records: List[Dict], table_name: str) -> None:
     if 'ID' in sorted_keys:
         sorted_keys.remove('ID')
         sorted_keys = ['ID'] + sorted_keys
+    return sorted_keys
+
+
+def _clip(text: str, width: int) -> str:
+    """Обрезает ячейку до ширины столбца"""
+    return text if len(text) <= width else text[:width - 1] + "…"
+
+
+def _layout(
+    sample: List[Dict], columns: List[str]
+) -> Tuple[List[str], List[int]]:
+    """Ширины столбцов по выборке строк, не больше MAX_CELL_WIDTH"""
+    widths = []
+    for column in columns:
+        longest = max(
+            (len(str(record.get(column, ''))) for record in sample),
+            default=0,
+        )
+        widths.append(min(max(longest, len(column)), MAX_CELL_WIDTH))
+    return columns, widths
+
+
+def _render_rows(
+    records: Iterable[Dict],
+    layout: Tuple[List[str], List[int]],
+    out: TextIO,
+    header: bool = True,
+) -> None:
+    """Пишет заголовок (если header) и строки в out по ширинам layout.
+
+    Ячейка шире выборки, но не длиннее MAX_CELL_WIDTH, выводится
+    целиком и только сдвигает строку.
+    """
+    columns, widths = layout
+    template = " | ".join(
+        [f"{{:<{width}}}" for width in widths[:-1]] + ["{}"]
+    ) + "\n"
+    if header:
+        out.write(template.format(
+            *(_clip(column, MAX_CELL_WIDTH) for column in columns)
+        ))
+        out.write("-" * sum(widths + [3 * (len(widths) - 1)]) + "\n")
     
-    header = " | ".join(sorted_keys)
-    print(header)
-    print("-" * len(header))
-    
+    write, render = out.write, template.format
     for record in records:
-        row = []
-        for key in sorted_keys:
-            value = record.get(key, '')
-            row.append(str(value))
-        print(" | ".join(row))
+        cells = [str(record.get(column, '')) for column in columns]
+        write(render(*[
+            cell if len(cell) <= MAX_CELL_WIDTH else _clip(cell, MAX_CELL_WIDTH)
+            for cell in cells
+        ]))
+
+
+def print_paged(
+    records: Iterable[Dict],
+    table_name: str,
+    columns: Optional[List[str]] = None,
+    page_size: int = PAGE_SIZE,
+    more: Optional[Callable[[], bool]] = None,
+) -> int:
+    """Выводит записи страницами, читая их из итератора по мере вывода.
+
+    Ширины столбцов берутся по первой странице. Каждая страница
+    собирается в буфер и выводится одной записью. После каждой полной
+    страницы more() решает, показывать ли следующую; без more выводится
+    всё. Возвращает число показанных записей.
+    """
+    records = iter(records)
+    page = list(islice(records, page_size))
+    if not page:
+        print(f"Таблица '{table_name}' пуста")
+        return 0
+    
+    layout = _layout(page[:RENDER_SAMPLE_ROWS], _column_order(page, columns))
+    sys.stdout.write(f"\n Данные таблицы '{table_name}':\n{'=' * 50}\n")
+    
+    # Заголовок - один раз на результат; повторяется только после
+    # вопроса more(), который разрывает вывод
+    shown = 0
+    while page:
+        out = io.StringIO()
+        _render_rows(page, layout, out, header=not shown or more is not None)
+        sys.stdout.write(out.getvalue())
+        shown += len(page)
+        page = list(islice(records, page_size)) if len(page) == page_size else []
+        if page and more is not None and not more():
+            print(f"Показано записей: {shown}")
+            return shown
     
-    print(f"Всего записей: {len(records)}")
+    print(f"Всего записей: {shown}")
+    return shown
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Векторное вычисление условий WHERE на NumPy (необязательная зависимость).
+
+Столбцы int и bool читаются как ndarray из буферов ColumnStore,
+условие превращается в булеву маску, позиции - np.flatnonzero.
+Листья над str вычисляются один раз на каждую строку словаря, а маска
+получается выборкой по кодам. Без NumPy или для неподдерживаемого
+условия возвращается None, и планировщик сканирует на Python.
+"""
+from typing import Any, List, Optional, Tuple
+
+from src.primitive_db.columnar import (
+    INT64_MAX,
+    INT64_MIN,
+    BoolColumn,
+    ColumnStore,
+    StrColumn,
+)
+from src.primitive_db.conditions import (
+    OPERATORS,
+    And,
+    Between,
+    Compare,
+    Expr,
+    InList,
+    Like,
+    Not,
+    Or,
+)
+from src.primitive_db.constants import VECTORIZE_MIN_ROWS
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def available() -> bool:
+    """Установлен ли NumPy."""
+    return np is not None
+
+
+def column_array(store: ColumnStore, name: str) -> Any:
+    """ndarray значений столбца на позициях хранилища (для str - коды).
+
+    Столбец в памяти копируется срезом: ndarray поверх самого array не
+    дал бы писателю дописывать столбец, пока идёт запрос по снимку.
+    Столбец сегмента (memoryview над mmap) читается без копирования.
+    """
+    column = store.columns[name]
+    rows = len(store)
+    if isinstance(column, StrColumn):
+        return np.frombuffer(column.codes[:rows], dtype=np.int64)
+    if isinstance(column, BoolColumn):
+        return np.frombuffer(column.data[:rows], dtype=np.bool_)
+    return np.frombuffer(column.data[:rows], dtype=np.int64)
+
+
+def _fits_int64(values: List[Any]) -> bool:
+    return all(
+        not isinstance(value, int) or INT64_MIN <= value <= INT64_MAX
+        for value in values
+    )
+
+
+def _leaf_mask(expr: Expr, store: ColumnStore) -> Optional[Any]:
+    column = store.columns[expr.column]
+    if isinstance(column, StrColumn):
+        # Предикат над словарём, затем выборка по кодам строк
+        matches = np.fromiter(
+            (expr.predicate({expr.column: value}) for value in column.dictionary),
+            dtype=np.bool_,
+            count=len(column.dictionary),
+        )
+        return matches[column_array(store, expr.column)]
+
+    values = column_array(store, expr.column)
+    if isinstance(expr, Compare):
+        if not _fits_int64([expr.value]):
+            return None
+        return OPERATORS[expr.operator](values, expr.value)
+    if isinstance(expr, InList):
+        if not _fits_int64(list(expr.values)):
+            return None
+        return np.isin(values, list(expr.values))
+    if isinstance(expr, Between):
+        if not _fits_int64([expr.low, expr.high]):
+            return None
+        return (values >= expr.low) & (values <= expr.high)
+    return None
+
+
+def mask(expr: Expr, store: ColumnStore) -> Optional[Any]:
+    """Булева маска условия по всем позициям или None."""
+    if isinstance(expr, (Compare, InList, Between, Like)):
+        return _leaf_mask(expr, store)
+    if isinstance(expr, Not):
+        inner = mask(expr.item, store)
+        return None if inner is None else ~inner
+    if isinstance(expr, (And, Or)):
+        combine = np.logical_and if isinstance(expr, And) else np.logical_or
+        result = None
+        for item in expr.items:
+            item_mask = mask(item, store)
+            if item_mask is None:
+                return None
+            result = item_mask if result is None else combine(result, item_mask)
+        return result
+    return None
+
+
+def matching_positions(expr: Expr, store: ColumnStore) -> Optional[List[int]]:
+    """Позиции живых строк под условием или None, если векторно нельзя."""
+    if np is None or len(store) < VECTORIZE_MIN_ROWS:
+        return None
+    result = mask(expr, store)
+    if result is None:
+        return None
+    result &= np.frombuffer(store.alive, dtype=np.bool_)
+    return np.flatnonzero(result).tolist()
+
+
+def aggregate(
+    store: ColumnStore,
+    positions: List[int],
+    aggregates: List[Tuple[str, Optional[str]]],
+) -> Optional[List[Any]]:
+    """Агрегаты без группировки по столбцам int/bool или None.
+
+    None - если NumPy нет, строк мало, есть столбец str или сумма может
+    выйти за int64.
+    """
+    if np is None or not positions or len(positions) < VECTORIZE_MIN_ROWS:
+        return None
+    columns = {column for func, column in aggregates if func != "count"}
+    if any(isinstance(store.columns[name], StrColumn) for name in columns):
+        return None
+
+    selected = np.asarray(positions, dtype=np.int64)
+    arrays = {name: column_array(store, name)[selected] for name in columns}
+    results = []
+    for func, column in aggregates:
+        if func == "count":
+            results.append(len(positions))
+            continue
+        values = arrays[column]
+        if func in ("min", "max"):
+            results.append(getattr(values, func)().item())
+            continue
+        values = values.astype(np.int64)
+        bound = max(-int(values.min()), int(values.max()))
+        if bound * len(values) > INT64_MAX:
+            return None
+        total = int(values.sum())
+        results.append(total if func == "sum" else total / len(values))
+    return results
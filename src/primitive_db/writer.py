@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Запись изменений на диск: сразу или фоновым потоком.
+
+Database.flush превращает изменённые таблицы в задания:
+
+    ('wal', таблица, операции)        дописать журнал
+    ('checkpoint', таблица, хранилище, счётчик ID)
+                                      переписать сегмент, очистить журнал
+    ('remove', таблица)               удалить файлы таблицы
+    ('metadata', каталог)             сохранить db_meta.json
+
+Фоновый поток ждёт не дольше max_delay после первого задания и
+склеивает накопившиеся: журнал одной таблицы дописывается одним fsync,
+контрольная точка или удаление отменяют предыдущие записи той же
+таблицы, каталог пишется один раз - последний.
+
+После ошибки записи поток ничего больше не пишет: ошибку и
+невыполненные задания забирает take_failure().
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.primitive_db.utils import (
+    append_wal,
+    clear_wal,
+    remove_table_data,
+    save_metadata,
+    save_table_data,
+)
+
+Task = Tuple[Any, ...]
+
+
+def coalesce(tasks: List[Task]) -> List[Task]:
+    """Склеивает задания; порядок по каждой таблице сохраняется."""
+    tables: Dict[str, List[Task]] = {}
+    catalog = None
+    for task in tasks:
+        kind = task[0]
+        if kind == 'metadata':
+            catalog = task
+            continue
+        actions = tables.setdefault(task[1], [])
+        if kind in ('checkpoint', 'remove'):
+            actions[:] = [task]
+        elif actions and actions[-1][0] == 'wal':
+            actions[-1] = ('wal', task[1], actions[-1][2] + task[2])
+        else:
+            actions.append(task)
+    merged = [action for actions in tables.values() for action in actions]
+    if catalog is not None:
+        merged.append(catalog)
+    return merged
+
+
+def write_tasks(
+    tasks: List[Task],
+    metadata_file: str,
+    data_dir: str,
+    verbose: bool = True,
+) -> None:
+    """Выполняет задания; каталог - после данных таблиц.
+
+    Ошибка записи (OSError) не перехватывается: журнал очищается, только
+    когда сегмент уже заменён. Выполненные задания убираются из tasks,
+    и после ошибки в нём остаются невыполненные.
+    """
+    tasks[:] = coalesce(tasks)
+    while tasks:
+        task = tasks[0]
+        kind = task[0]
+        if kind == 'wal':
+            append_wal(task[1], task[2], data_dir)
+        elif kind == 'checkpoint':
+            save_table_data(
+                task[1], task[2], data_dir, verbose=verbose, sequence=task[3]
+            )
+            clear_wal(task[1], data_dir)
+        elif kind == 'remove':
+            remove_table_data(task[1], data_dir)
+        else:
+            save_metadata(metadata_file, task[1], verbose)
+        del tasks[0]
+
+
+class BackgroundWriter:
+    """Поток, который пишет задания пачками не реже раза в max_delay."""
+
+    def __init__(
+        self,
+        metadata_file: str,
+        data_dir: str,
+        max_delay: float,
+        on_written: Optional[Callable[[], None]] = None,
+        on_idle: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self.metadata_file = metadata_file
+        self.data_dir = data_dir
+        self.max_delay = max_delay
+        # Вызывается потоком после записи пачки (до того, как она
+        # перестанет считаться незаписанной)
+        self.on_written = on_written
+        # Вызывается под condition, когда всё записано и holds == 0
+        self.on_idle = on_idle
+        # Сколько команд сейчас рассчитывают на то, что пачки ещё пишутся
+        self.holds = 0
+        self.queue: List[Task] = []
+        self.busy = False
+        self.closed = False
+        # Ошибка записи и невыполненные задания пачки, на которой она
+        # случилась; пока ошибку не забрали, поток стоит
+        self.error: Optional[Exception] = None
+        self.failed: List[Task] = []
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(
+            target=self._run, name="primitive-db-writer", daemon=True
+        )
+        self.thread.start()
+
+    def submit(self, tasks: List[Task]) -> None:
+        """Ставит задания в очередь и сразу возвращается.
+
+        После ошибки записи они ждут в очереди take_failure().
+        """
+        with self.condition:
+            if self.closed:
+                raise ValueError("Фоновая запись уже остановлена")
+            self.queue.extend(tasks)
+            self.condition.notify_all()
+
+    def pending(self) -> bool:
+        """Есть ли задания, ещё не записанные на диск."""
+        with self.condition:
+            return self.pending_locked()
+
+    def pending_locked(self) -> bool:
+        """То же, что pending, под уже взятым condition.
+
+        Незабранная ошибка тоже считается: блокировка базы держится,
+        пока её не вернут в сессию.
+        """
+        return (
+            bool(self.queue) or self.busy or self.holds > 0
+            or self.error is not None
+        )
+
+    def wait(self) -> None:
+        """Ждёт, пока всё поставленное не окажется на диске или не
+        случится ошибка записи."""
+        with self.condition:
+            while (self.queue or self.busy) and self.error is None:
+                self.condition.wait()
+
+    def take_failure(self) -> Optional[Tuple[Exception, List[Task]]]:
+        """Ошибка записи и все невыполненные задания, по порядку.
+
+        None - ошибок не было. После вызова поток снова пишет.
+        """
+        with self.condition:
+            if self.error is None:
+                return None
+            failure = (self.error, self.failed + self.queue)
+            self.error, self.failed, self.queue = None, [], []
+            self.condition.notify_all()
+            return failure
+
+    def close(self) -> None:
+        """Дописывает очередь и останавливает поток.
+
+        После ошибки записи поток останавливается сразу.
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+
+    def _run(self) -> None:
+        while True:
+            with self.condition:
+                while (
+                    not self.queue or self.error is not None
+                ) and not self.closed:
+                    self.condition.wait()
+                if not self.queue or self.error is not None:
+                    return
+                deadline = time.monotonic() + self.max_delay
+                while not self.closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                batch, self.queue = self.queue, []
+                self.busy = True
+            error = None
+            try:
+                try:
+                    write_tasks(batch, self.metadata_file, self.data_dir, False)
+                finally:
+                    # Часть файлов могла измениться и до ошибки
+                    if self.on_written is not None:
+                        self.on_written()
+            except Exception as e:
+                error = e
+            with self.condition:
+                self.busy = False
+                if error is not None:
+                    # write_tasks оставил в batch невыполненные задания
+                    self.error, self.failed = error, batch
+                if not self.pending_locked() and self.on_idle is not None:
+                    self.on_idle()
+                self.condition.notify_all()